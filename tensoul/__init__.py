@@ -1 +1,36 @@
-from .downloader import MajsoulPaipuDownloader
+import importlib
+from typing import TYPE_CHECKING
+
+# submodules are imported on first access, so that e.g. parser-only users
+# don't pay for aiohttp, websockets and ms.protocol_pb2
+_LAZY_ATTRS = {
+    "MajsoulPaipuDownloader": ".downloader",
+    "MajsoulPaipuDownloaderPool": ".pool",
+    "MajsoulAccount": ".pool",
+    "LRUCache": ".cache",
+    "FileTokenStore": ".token_store",
+    "MajsoulPaipuParser": ".parser",
+}
+
+__all__ = tuple(_LAZY_ATTRS)
+
+if TYPE_CHECKING:
+    from .downloader import MajsoulPaipuDownloader
+    from .pool import MajsoulPaipuDownloaderPool, MajsoulAccount
+    from .cache import LRUCache
+    from .token_store import FileTokenStore
+    from .parser import MajsoulPaipuParser
+
+
+def __getattr__(name: str):
+    module = _LAZY_ATTRS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRS))
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Generic, TypeVar, Optional, Callable, Any, Awaitable, Hashable
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+def json_sizeof(value: Any) -> int:
+    """
+    approximate memory cost of a converted log by its serialized length
+    """
+    return len(json.dumps(value, ensure_ascii=False))
+
+
+class LRUCache(Generic[K, V]):
+    """
+    bounded LRU cache, evicting by entry count, total size and age
+    """
+
+    def __init__(self, maxsize: int = 1024, *,
+                 max_bytes: Optional[int] = None,
+                 ttl: Optional[float] = None,
+                 sizeof: Callable[[V], int] = json_sizeof):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+
+        self._data: OrderedDict[K, tuple[V, int, float]] = OrderedDict()  # key -> (value, size, expires at)
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key: K) -> bool:
+        return self.get(key) is not None
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+
+        value, size, expires_at = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            return default
+
+        self._data.move_to_end(key)
+        return value
+
+    def put(self, key: K, value: V):
+        if key in self._data:
+            self._remove(key)
+
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            # never fits, don't flush everything else for it
+            return
+
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else float("inf")
+        self._data[key] = (value, size, expires_at)
+        self.nbytes += size
+
+        while len(self._data) > self.maxsize or self.max_bytes is not None and self.nbytes > self.max_bytes:
+            self._remove(next(iter(self._data)))
+
+    def pop(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        self._remove(key)
+        return entry[0]
+
+    def clear(self):
+        self._data.clear()
+        self.nbytes = 0
+
+    def _remove(self, key: K):
+        _, size, _ = self._data.pop(key)
+        self.nbytes -= size
+
+
+class SingleFlight(Generic[K, V]):
+    """
+    coalesce concurrent calls with the same key into a single call.
+
+    the call runs in its own task, so cancelling one waiter doesn't affect the others.
+    once every waiter is gone (e.g. all of them hit their deadline), the call is cancelled.
+    """
+
+    def __init__(self):
+        self._inflight: dict[K, asyncio.Task] = {}
+        self._waiters: dict[asyncio.Task, int] = {}
+
+    def __len__(self):
+        return len(self._inflight)
+
+    async def do(self, key: K, fn: Callable[[], Awaitable[V]]) -> V:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[task] -= 1
+            if self._waiters[task] == 0:
+                del self._waiters[task]
+                if not task.done():
+                    # nobody is waiting anymore, don't leave it hanging. the next call starts over
+                    task.cancel()
+                    if self._inflight.get(key) is task:
+                        del self._inflight[key]
+
+    def _done(self, key: K, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # mark the exception retrieved in case every waiter has gone
+            task.exception()
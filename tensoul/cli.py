@@ -0,0 +1,194 @@
+import asyncio
+import json
+import os
+import sys
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable, TextIO, Optional
+
+from .downloader import MajsoulPaipuDownloader, MajsoulDownloadError
+
+
+class ProgressJournal:
+    """
+    append-only list of record uuids already written, so an interrupted run can resume
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.done = set()
+
+        if path.exists():
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        self.done.add(line)
+
+        self._f: TextIO = open(path, "a", encoding="utf-8")
+
+    def __contains__(self, record_uuid: str) -> bool:
+        return record_uuid in self.done
+
+    def mark(self, record_uuid: str):
+        self.done.add(record_uuid)
+        self._f.write(record_uuid + "\n")
+        self._f.flush()
+
+    def close(self):
+        self._f.close()
+
+
+def read_uuids(lines: Iterable[str]) -> list[str]:
+    uuids = []
+    seen = set()
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#") or line in seen:
+            continue
+        # accept whole log links too: https://game.maj-soul.com/1/?paipu=<uuid>_a12345678
+        if "paipu=" in line:
+            line = line.split("paipu=", 1)[1].split("_", 1)[0]
+        seen.add(line)
+        uuids.append(line)
+    return uuids
+
+
+def write_json_atomic(path: Path, obj):
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+class BulkDownloader:
+    def __init__(self, downloader: MajsoulPaipuDownloader, output: Path, journal: ProgressJournal, *,
+                 concurrency: int = 8, report_interval: float = 5.0):
+        self.downloader = downloader
+        self.output = output
+        self.journal = journal
+        self.concurrency = concurrency
+        self.report_interval = report_interval
+
+        self.total = 0
+        self.succeeded = 0
+        self.failed = 0
+        self._begin = 0.0
+
+    async def run(self, uuids: list[str]):
+        pending = [u for u in uuids if u not in self.journal]
+        if len(pending) != len(uuids):
+            print(f"skipping {len(uuids) - len(pending)} records already downloaded", file=sys.stderr)
+
+        self.total = len(pending)
+        self._begin = time.monotonic()
+
+        queue = asyncio.Queue()
+        for u in pending:
+            queue.put_nowait(u)
+
+        reporter = asyncio.create_task(self._report_forever())
+        try:
+            await asyncio.gather(*[self._worker(queue) for _ in range(self.concurrency)])
+        finally:
+            reporter.cancel()
+            self._report()
+
+    async def _worker(self, queue: asyncio.Queue):
+        while not queue.empty():
+            record_uuid = queue.get_nowait()
+            try:
+                logs = await self.downloader.download(record_uuid)
+            except MajsoulDownloadError as e:
+                self.failed += 1
+                print(f"{record_uuid}: download failed with code {e.code}", file=sys.stderr)
+                continue
+            except asyncio.TimeoutError:
+                self.failed += 1
+                print(f"{record_uuid}: download timed out", file=sys.stderr)
+                continue
+            except Exception as e:
+                self.failed += 1
+                print(f"{record_uuid}: {type(e).__name__}: {e}", file=sys.stderr)
+                continue
+
+            write_json_atomic(self.output / f"{record_uuid}.json", logs)
+            self.journal.mark(record_uuid)
+            self.succeeded += 1
+
+    async def _report_forever(self):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            self._report()
+
+    def _report(self):
+        elapsed = time.monotonic() - self._begin
+        finished = self.succeeded + self.failed
+        rate = finished / elapsed if elapsed > 0 else 0.0
+        print(f"{finished}/{self.total} done, {self.failed} failed, "
+              f"{rate:.2f} records/s, {elapsed:.1f}s elapsed", file=sys.stderr)
+
+
+async def run(username: str, password: str, uuids: list[str], output: Path, journal_path: Path, *,
+              concurrency: int, report_interval: float, workers: int = 0, timeout: Optional[float] = None):
+    output.mkdir(parents=True, exist_ok=True)
+    journal = ProgressJournal(journal_path)
+    executor = ProcessPoolExecutor(workers) if workers > 0 else None
+    try:
+        async with MajsoulPaipuDownloader(executor=executor, timeout=timeout) as downloader:
+            await downloader.login(username, password)
+            bulk = BulkDownloader(downloader, output, journal,
+                                  concurrency=concurrency, report_interval=report_interval)
+            await bulk.run(uuids)
+            return bulk.failed
+    finally:
+        journal.close()
+        if executor is not None:
+            executor.shutdown()
+
+
+def main():
+    parser = ArgumentParser(description="Download MahjongSoul logs in tenhou.net/6 format.")
+    parser.add_argument("records", nargs="*", help="Record UUIDs to download.")
+    parser.add_argument("-i", "--input", help="File of record UUIDs, one per line. '-' for stdin.", dest="input")
+    parser.add_argument("-o", "--output", help="Output directory. (default: records)", dest="output",
+                        default="records")
+    parser.add_argument("-j", "--concurrency", help="Number of records downloaded at once. (default: 8)",
+                        dest="concurrency", type=int, default=8)
+    parser.add_argument("-w", "--workers", help="Number of processes converting records, 0 to convert in the "
+                                                "main process. (default: 0)", dest="workers", type=int, default=0)
+    parser.add_argument("-t", "--timeout", help="Seconds before a download is given up. (default: no limit)",
+                        dest="timeout", type=float)
+    parser.add_argument("--journal", help="Progress journal for resuming. (default: <output>/.progress)",
+                        dest="journal")
+    parser.add_argument("--report-interval", help="Seconds between throughput reports. (default: 5)",
+                        dest="report_interval", type=float, default=5.0)
+    parser.add_argument("-u", "--username", help="Your account name. (default: $TENSOUL_USERNAME)",
+                        dest="username", default=os.environ.get("TENSOUL_USERNAME"))
+    parser.add_argument("-p", "--password", help="Your account password. (default: $TENSOUL_PASSWORD)",
+                        dest="password", default=os.environ.get("TENSOUL_PASSWORD"))
+
+    args = parser.parse_args()
+    if not args.username or not args.password:
+        parser.error("username and password are required")
+
+    lines = list(args.records)
+    if args.input == "-" or args.input is None and len(lines) == 0:
+        lines.extend(sys.stdin)
+    elif args.input is not None:
+        with open(args.input, "r", encoding="utf-8") as f:
+            lines.extend(f)
+
+    output = Path(args.output)
+    journal = Path(args.journal) if args.journal else output / ".progress"
+
+    failed = asyncio.run(run(args.username, args.password, read_uuids(lines), output, journal,
+                             concurrency=args.concurrency, report_interval=args.report_interval,
+                             workers=args.workers, timeout=args.timeout))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+from concurrent.futures import Executor
+from datetime import datetime
+from itertools import repeat
+from typing import Optional, Sequence
+
+import ms.protocol_pb2 as pb
+
+from .cfg import cfg
+from .constants import RUNES, JPNAME
+from .errors import MajsoulDownloadError
+from .fingerprint import converter_fingerprint
+from .parser import MajsoulPaipuParser
+from .record import iter_records, split_kyokus, decode_message
+
+
+def _convert_head(record) -> tuple[dict, bool]:
+    """
+    :return: everything but the log, and whether the game has tsumo loss off
+    """
+    res = {}
+    ruledisp = ""
+    lobby = ""  # usually 0, is the custom lobby number
+    nplayers = len(record.head.result.players)
+    nakas = nplayers - 1  # default
+    tsumoloss_off = False
+
+    res["ver"] = "2.3"  # mlog version number
+    res["fingerprint"] = converter_fingerprint()  # converter that made this log, to tell which logs are outdated
+    res["ref"] = record.head.uuid  # game id - copy and paste into "other" on the log page to view
+
+    # PF4 is yonma, PF3 is sanma
+    res["ratingc"] = f"PF{nplayers}"
+
+    # rule display
+    if nplayers == 3:
+        ruledisp += RUNES["sanma"][JPNAME]
+    if record.head.config.meta.mode_id:  # ranked or casual
+        ruledisp += cfg["desktop"]["matchmode"]["map_"][str(record.head.config.meta.mode_id)]["room_name_jp"]
+    elif record.head.config.meta.room_id:  # friendly
+        lobby = f": {record.head.config.meta.room_id}"  # can set room number as lobby number
+        ruledisp += RUNES["friendly"][JPNAME]  # "Friendly"
+        nakas = record.head.config.mode.detail_rule.dora_count
+        tsumoloss_off = nplayers == 3 and not record.head.config.mode.detail_rule.have_zimosun
+    elif record.head.config.meta.contest_uid:  # tourney
+        lobby = f": {record.head.config.meta.contest_uid}"
+        ruledisp += RUNES["tournament"][JPNAME]  # "Tournament"
+        nakas = record.head.config.mode.detail_rule.dora_count
+        tsumoloss_off = nplayers == 3 and not record.head.config.mode.detail_rule.have_zimosun
+
+    if record.head.config.mode.mode == 1:
+        ruledisp += RUNES["tonpuu"][JPNAME]  # " East"
+    elif record.head.config.mode.mode == 2:
+        ruledisp += RUNES["hanchan"][JPNAME]
+
+    if record.head.config.meta.mode_id == 0 and record.head.config.mode.detail_rule.dora_count == 0:
+        res["rule"] = {"disp": ruledisp, "aka53": 0, "aka52": 0, "aka51": 0}
+    else:
+        res["rule"] = {"disp": ruledisp, "aka53": 1, "aka52": 2 if nakas == 4 else 1,
+                       "aka51": 1 if nplayers == 4 else 0}
+
+    # tenhou custom lobby - could be tourney id or friendly room for mjs. appending to title instead to avoid 3->C etc. in tenhou.net/5
+    res["lobby"] = 0
+
+    # autism to fix logs with AI
+    # ranks
+    res["dan"] = [""] * nplayers
+    for e in record.head.accounts:
+        res["dan"][e.seat] = cfg["level_definition"]["level_definition"]["map_"][str(e.level.id)]["full_name_jp"]
+
+    # level score, no real analog to rate
+    res["rate"] = [0] * nplayers
+    for e in record.head.accounts:
+        res["rate"][e.seat] = e.level.score  # level score, closest thing to rate
+
+    # sex
+    res["sx"] = ['C'] * nplayers
+
+    # >names
+    res["name"] = ["AI"] * nplayers
+    for e in record.head.accounts:
+        res["name"][e.seat] = e.nickname
+
+    # scores
+    scores = [[e.seat, e.part_point_1, e.total_point / 1000] for e in record.head.result.players]
+    res["sc"] = [0] * nplayers * 2
+    for i, e in enumerate(scores):
+        res["sc"][2 * e[0]] = e[1]
+        res["sc"][2 * e[0] + 1] = e[2]
+
+    # optional title - why not give the room and put the timestamp here
+    res["title"] = [ruledisp + lobby, datetime.fromtimestamp(record.head.end_time).strftime("%Y-%m-%d %H:%M:%S")]
+
+    return res, tsumoloss_off
+
+
+def convert_game_record(record, *, executor: Optional[Executor] = None, fast_encode: bool = False) -> dict:
+    """
+    convert a ResGameRecord into tenhou.net/6 format
+
+    :param executor: convert the kyokus in parallel in this pool, instead of the whole game in a row
+    :param fast_encode: encode while parsing, without building symbol objects. same output, less work per record
+    """
+    res, tsumoloss_off = _convert_head(record)
+
+    if executor is None:
+        converter = MajsoulPaipuParser(tsumoloss_off=tsumoloss_off, fast_encode=fast_encode)
+        for log in iter_records(record.data):
+            converter.feed(log)
+
+        res["log"] = [e.dump() for e in converter.getvalue()]
+    else:
+        # kyokus only share the final list, parser state is reset by every RecordNewRound
+        kyokus = split_kyokus(record.data)
+        res["log"] = list(executor.map(convert_kyoku, kyokus, repeat(tsumoloss_off), repeat(fast_encode)))
+
+    return res
+
+
+def convert_game_record_lazy(record, *, fast_encode: bool = False) -> dict:
+    """
+    like convert_game_record, but a kyoku of the log is only converted once it is accessed.
+
+    the log is a LazyKyokuLog, which json can't serialize: replace it by list(res["log"]) before json.dump
+    """
+    res, tsumoloss_off = _convert_head(record)
+    res["log"] = LazyKyokuLog(split_kyokus(record.data), tsumoloss_off, fast_encode)
+    return res
+
+
+def convert_kyoku(records: Sequence[tuple[str, bytes]], tsumoloss_off: bool = False,
+                  fast_encode: bool = False) -> list:
+    """
+    convert the (name, data) records of a single kyoku, as split by split_kyokus, into tenhou.net/6 format
+    """
+    converter = MajsoulPaipuParser(tsumoloss_off=tsumoloss_off, fast_encode=fast_encode)
+    for name, data in records:
+        converter.feed(decode_message(name, data))
+
+    return converter.getvalue()[0].dump()
+
+
+class LazyKyokuLog(Sequence):
+    """
+    log converting each kyoku on first access. list() it before json.dump
+    """
+
+    def __init__(self, kyokus: list[list[tuple[str, bytes]]], tsumoloss_off: bool = False,
+                 fast_encode: bool = False):
+        self._kyokus = kyokus
+        self._tsumoloss_off = tsumoloss_off
+        self._fast_encode = fast_encode
+        self._converted = {}
+
+    def __len__(self):
+        return len(self._kyokus)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("kyoku index out of range")
+
+        if idx not in self._converted:
+            self._converted[idx] = convert_kyoku(self._kyokus[idx], self._tsumoloss_off, self._fast_encode)
+        return self._converted[idx]
+
+
+def convert_game_record_bytes(data: bytes, *, fast_encode: bool = False) -> dict:
+    """
+    convert a serialized ResGameRecord, as returned by the fetchGameRecord rpc, into tenhou.net/6 format.
+
+    being a module-level function of bytes, it can run in a process pool.
+    """
+    record = pb.ResGameRecord()
+    record.ParseFromString(data)
+
+    if record.error.code:
+        raise MajsoulDownloadError(code=record.error.code)
+
+    return convert_game_record(record, fast_encode=fast_encode)
@@ -1,8 +1,12 @@
+import asyncio
 import hashlib
 import hmac
 import random
 import uuid
-from datetime import datetime
+from collections import deque
+from concurrent.futures import Executor
+from functools import partial
+from typing import Optional
 
 import aiohttp
 import ms.protocol_pb2 as pb
@@ -10,32 +14,82 @@ from ms.base import MSRPCChannel
 from ms.rpc import Lobby
 from websockets.exceptions import ConnectionClosedError
 
-from .cfg import cfg
-from .constants import RUNES, JPNAME
-from .parser import MajsoulPaipuParser
+from .cache import LRUCache, SingleFlight
+from .converter import convert_game_record, convert_game_record_bytes
+from .errors import MajsoulLoginError, MajsoulDownloadError
+from .store import ConvertedLogStore, convert_with_features
+from .token_store import TokenStore, DEFAULT_TOKEN_STORE
 
 
-class MajsoulLoginError(BaseException):
-    ...
+async def _send_request(channel: MSRPCChannel, name: str, data: bytes) -> bytes:
+    """
+    channel.send_request, dropping the request's entries when it is cancelled (a lost hedge, a timeout).
+    the channel leaves them behind otherwise, and a late response would be kept until the request index wraps around
+    """
+    missing = [f for f in ("_new_req_idx", "_req_events", "_res") if not hasattr(channel, f)]
+    if len(missing) != 0:
+        raise RuntimeError(f"MSRPCChannel of this ms-api version has no {', '.join(missing)}, "
+                           f"cancelled requests can't be cleaned up")
 
-
-class MajsoulDownloadError(BaseException):
-    def __init__(self, code: int):
-        self.code = code
+    idx = channel._new_req_idx  # taken by send_request before its first await
+    try:
+        return await channel.send_request(name, data)
+    except BaseException:
+        channel._req_events.pop(idx, None)
+        channel._res.pop(idx, None)
+        raise
 
 
 class MajsoulPaipuDownloader:
     MS_HOST = "https://game.maj-soul.com"
 
+    def __init__(self, *, cache: Optional[LRUCache] = None, executor: Optional[Executor] = None,
+                 token_store: Optional[TokenStore] = DEFAULT_TOKEN_STORE,
+                 store: Optional[ConvertedLogStore] = None,
+                 timeout: Optional[float] = None,
+                 hedge: bool = False, hedge_percentile: float = 0.95, hedge_min_delay: float = 0.05,
+                 fast_encode: bool = False):
+        """
+        :param cache: keep converted logs by record uuid. cached logs are shared between callers, don't mutate them
+        :param executor: decode and convert records in this thread or process pool instead of on the event loop
+        :param token_store: remember access tokens so later logins skip the password. None to disable
+        :param store: keep raw records and converted logs. a record already in it is never fetched again,
+                      only converted again when the converter changed
+        :param timeout: default deadline in seconds of download() and fetch_game_record()
+        :param hedge: log in on a second gateway channel too, and repeat a fetch there when it takes longer than
+                      the hedge_percentile of recent fetch latencies (but at least hedge_min_delay seconds).
+                      the first response wins
+        :param fast_encode: convert with the parser's fast encode mode, skipping the intermediate symbol objects
+        """
+        self.channel = None
+        self.lobby = None
+        self.token = None
+
+        self.timeout = timeout
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_channel = None
+        self.hedge_lobby = None
+        self._latencies = deque(maxlen=256)
+
+        self.cache = cache
+        self.executor = executor
+        self.token_store = token_store
+        self.store = store
+        self.fast_encode = fast_encode
+        self._inflight = SingleFlight()
+
     async def start(self):
         await self._connect()
 
     async def close(self):
-        try:
-            if self.channel:
-                await self.channel.close()
-        except ConnectionClosedError:
-            pass
+        for channel in (self.channel, self.hedge_channel):
+            try:
+                if channel:
+                    await channel.close()
+            except ConnectionClosedError:
+                pass
 
     async def __aenter__(self):
         await self.start()
@@ -71,7 +125,69 @@ class MajsoulPaipuDownloader:
 
         await self.channel.connect(self.MS_HOST)
 
+        if self.hedge:
+            # prefer another gateway, so one slow gateway can't hold up both
+            others = [e for e in servers if e != server]
+            self.hedge_endpoint = "wss://{}/gateway".format(random.choice(others) if others else server)
+
+            self.hedge_channel = MSRPCChannel(self.hedge_endpoint)
+            self.hedge_lobby = Lobby(self.hedge_channel)
+
+            await self.hedge_channel.connect(self.MS_HOST)
+
     async def login(self, username, password):
+        if self.token_store is not None:
+            token = self.token_store.get(username)
+            if token:
+                if await self._login_with_token(username, token):
+                    await self._login_hedge()
+                    return
+                # expired or revoked
+                self.token_store.delete(username)
+
+        await self._login_with_password(username, password)
+
+        if self.token_store is not None:
+            self.token_store.set(username, self.token)
+
+        await self._login_hedge()
+
+    async def _login_hedge(self):
+        if self.hedge_lobby is None:
+            return
+
+        res = await self._oauth2_login(self.hedge_lobby, self.token)
+        if res.error.code or not res.account_id:
+            # hedging is best effort, carry on with the primary channel only
+            try:
+                await self.hedge_channel.close()
+            except ConnectionClosedError:
+                pass
+            self.hedge_channel = None
+            self.hedge_lobby = None
+
+    async def _login_with_token(self, username, token) -> bool:
+        res = await self._oauth2_login(self.lobby, token)
+        if res.error.code or not res.account_id:
+            return False
+
+        self.token = res.access_token or token
+        if self.token != token:
+            self.token_store.set(username, self.token)
+        return True
+
+    async def _oauth2_login(self, lobby: Lobby, token: str):
+        req = pb.ReqOauth2Login()
+        req.type = 0
+        req.access_token = token
+        req.device.is_browser = True
+        req.random_key = str(uuid.uuid1())
+        req.client_version_string = f"web-{self.version_to_force}"
+        req.currency_platforms.append(2)
+
+        return await lobby.oauth2_login(req)
+
+    async def _login_with_password(self, username, password):
         uuid_key = str(uuid.uuid1())
 
         req = pb.ReqLogin()
@@ -90,117 +206,124 @@ class MajsoulPaipuDownloader:
 
         self.token = token
 
-    async def download(self, record_uuid: str):
+    async def download(self, record_uuid: str, *, timeout: Optional[float] = None):
+        """
+        :param timeout: deadline in seconds, defaults to the one given to the constructor.
+                        raises asyncio.TimeoutError when exceeded
+        """
+        if self.cache is not None:
+            res = self.cache.get(record_uuid)
+            if res is not None:
+                return res
+
+        if timeout is None:
+            timeout = self.timeout
+
+        # concurrent downloads of the same record share one request and one conversion.
+        # a caller giving up on its deadline doesn't cancel it for the others, the last one does
+        return await asyncio.wait_for(self._inflight.do(record_uuid, lambda: self._download(record_uuid)), timeout)
+
+    async def _in_executor(self, executor: Optional[Executor], fn, *args):
+        # with no executor configured, everything runs on the loop as before
+        if self.executor is None:
+            return fn(*args)
+        return await asyncio.get_running_loop().run_in_executor(executor, partial(fn, *args))
+
+    async def _download(self, record_uuid: str):
+        data = None
+        if self.store is not None:
+            # the store is thread safe, its sqlite and json work goes to the default thread pool
+            res = await self._in_executor(None, self.store.get_log, record_uuid)
+            if res is not None:
+                if self.cache is not None:
+                    self.cache.put(record_uuid, res)
+                return res
+
+            data = await self._in_executor(None, self.store.get_raw, record_uuid)
+
+        fetched = data is None
+        if fetched:
+            data = await self.fetch_game_record(record_uuid)
+
+        # leave even the response decoding to the executor, the loop only moves bytes
+        features = None
+        if self.store is not None and fetched:
+            # the store needs the features of a new record, which means decoding every round record again
+            convert = partial(convert_with_features, fast_encode=self.fast_encode)
+            res, features = await self._in_executor(self.executor, convert, data)
+        else:
+            convert = partial(convert_game_record_bytes, fast_encode=self.fast_encode)
+            res = await self._in_executor(self.executor, convert, data)
+
+        if self.store is not None:
+            if fetched:
+                await self._in_executor(None, self.store.put_raw, record_uuid, data, features)
+            await self._in_executor(None, self.store.put_log, record_uuid, res)
+        if self.cache is not None:
+            self.cache.put(record_uuid, res)
+        return res
+
+    async def fetch_game_record(self, record_uuid: str, *, timeout: Optional[float] = None) -> bytes:
+        """
+        fetch the serialized ResGameRecord of a record
+
+        :param timeout: deadline in seconds, defaults to the one given to the constructor.
+                        raises asyncio.TimeoutError when exceeded
+        """
         req = pb.ReqGameRecord()
         req.game_uuid = record_uuid
         req.client_version_string = f'web-{self.version_to_force}'
-        res = await self.lobby.fetch_game_record(req)
-
-        if res.error.code:
-            raise MajsoulDownloadError(code=res.error.code)
-
-        return self._handle_game_record(res)
-
-    def _handle_game_record(self, record):
-        res = {}
-        ruledisp = ""
-        lobby = ""  # usually 0, is the custom lobby number
-        nplayers = len(record.head.result.players)
-        nakas = nplayers - 1  # default
-        tsumoloss_off = False
-
-        res["ver"] = "2.3"  # mlog version number
-        res["ref"] = record.head.uuid  # game id - copy and paste into "other" on the log page to view
-
-        # PF4 is yonma, PF3 is sanma
-        res["ratingc"] = f"PF{nplayers}"
-
-        # rule display
-        if nplayers == 3:
-            ruledisp += RUNES["sanma"][JPNAME]
-        if record.head.config.meta.mode_id:  # ranked or casual
-            ruledisp += cfg["desktop"]["matchmode"]["map_"][str(record.head.config.meta.mode_id)]["room_name_jp"]
-        elif record.head.config.meta.room_id:  # friendly
-            lobby = f": {record.head.config.meta.room_id}"  # can set room number as lobby number
-            ruledisp += RUNES["friendly"][JPNAME]  # "Friendly"
-            nakas = record.head.config.mode.detail_rule.dora_count
-            tsumoloss_off = nplayers == 3 and not record.head.config.mode.detail_rule.have_zimosun
-        elif record.head.config.meta.contest_uid:  # tourney
-            lobby = f": {record.head.config.meta.contest_uid}"
-            ruledisp += RUNES["tournament"][JPNAME]  # "Tournament"
-            nakas = record.head.config.mode.detail_rule.dora_count
-            tsumoloss_off = nplayers == 3 and not record.head.config.mode.detail_rule.have_zimosun
-
-        if record.head.config.mode.mode == 1:
-            ruledisp += RUNES["tonpuu"][JPNAME]  # " East"
-        elif record.head.config.mode.mode == 2:
-            ruledisp += RUNES["hanchan"][JPNAME]
-
-        if record.head.config.meta.mode_id == 0 and record.head.config.mode.detail_rule.dora_count == 0:
-            res["rule"] = {"disp": ruledisp, "aka53": 0, "aka52": 0, "aka51": 0}
-        else:
-            res["rule"] = {"disp": ruledisp, "aka53": 1, "aka52": 2 if nakas == 4 else 1,
-                           "aka51": 1 if nplayers == 4 else 0}
-
-        # tenhou custom lobby - could be tourney id or friendly room for mjs. appending to title instead to avoid 3->C etc. in tenhou.net/5
-        res["lobby"] = 0
-
-        # autism to fix logs with AI
-        # ranks
-        res["dan"] = [""] * nplayers
-        for e in record.head.accounts:
-            res["dan"][e.seat] = cfg["level_definition"]["level_definition"]["map_"][str(e.level.id)]["full_name_jp"]
-
-        # level score, no real analog to rate
-        res["rate"] = [0] * nplayers
-        for e in record.head.accounts:
-            res["rate"][e.seat] = e.level.score  # level score, closest thing to rate
-
-        # sex
-        res["sx"] = ['C'] * nplayers
-
-        # >names
-        res["name"] = ["AI"] * nplayers
-        for e in record.head.accounts:
-            res["name"][e.seat] = e.nickname
-
-        # scores
-        scores = [[e.seat, e.part_point_1, e.total_point / 1000] for e in record.head.result.players]
-        res["sc"] = [0] * nplayers * 2
-        for i, e in enumerate(scores):
-            res["sc"][2 * e[0]] = e[1]
-            res["sc"][2 * e[0] + 1] = e[2]
-
-        # optional title - why not give the room and put the timestamp here
-        res["title"] = [ruledisp + lobby, datetime.fromtimestamp(record.head.end_time).strftime("%Y-%m-%d %H:%M:%S")]
-
-        wrapper = pb.Wrapper()
-        wrapper.ParseFromString(record.data)
-
-        details = pb.GameDetailRecords()
-        details.ParseFromString(wrapper.data)
-
-        converter = MajsoulPaipuParser(tsumoloss_off=tsumoloss_off)
-        if details.version < 210715 and len(details.records) > 0:
-            for rec in details.records:
-                round_record_wrapper = pb.Wrapper()
-                round_record_wrapper.ParseFromString(rec)
-
-                log = getattr(pb, round_record_wrapper.name[len(".lq."):])()
-                log.ParseFromString(round_record_wrapper.data)
-                converter.feed(log)
-
-                res["log"] = [e.dump() for e in converter.getvalue()]
-        else:
-            for act in details.actions:
-                if len(act.result) != 0:
-                    round_record_wrapper = pb.Wrapper()
-                    round_record_wrapper.ParseFromString(act.result)
 
-                    log = getattr(pb, round_record_wrapper.name[len(".lq."):])()
-                    log.ParseFromString(round_record_wrapper.data)
-                    converter.feed(log)
+        if timeout is None:
+            timeout = self.timeout
 
-                    res["log"] = [e.dump() for e in converter.getvalue()]
+        return await asyncio.wait_for(self._fetch_game_record(req), timeout)
 
-        return res
+    async def _fetch_game_record(self, req) -> bytes:
+        loop = asyncio.get_running_loop()
+        begin = loop.time()
+
+        primary = asyncio.ensure_future(self._fetch_game_record_bytes(self.channel, req))
+        tasks = [primary]
+        try:
+            delay = self._hedge_delay()
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if len(done) == 0:
+                    tasks.append(asyncio.ensure_future(self._fetch_game_record_bytes(self.hedge_channel, req)))
+
+            pending = tasks
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next(iter(done))
+                # if one of them failed, still give the other a chance
+                if winner.exception() is None or len(pending) == 0:
+                    break
+
+            data = winner.result()
+        finally:
+            losers = [t for t in tasks if not t.done()]
+            for t in losers:
+                t.cancel()
+            # let them drop their requests from the channel before going on
+            await asyncio.gather(*losers, return_exceptions=True)
+
+        self._latencies.append(loop.time() - begin)
+        return data
+
+    def _hedge_delay(self) -> Optional[float]:
+        # too few samples to tell what's slow
+        if self.hedge_lobby is None or len(self._latencies) < 20:
+            return None
+
+        latencies = sorted(self._latencies)
+        idx = min(int(len(latencies) * self.hedge_percentile), len(latencies) - 1)
+        return max(latencies[idx], self.hedge_min_delay)
+
+    async def _fetch_game_record_bytes(self, channel: MSRPCChannel, req) -> bytes:
+        method = ".{}.{}.fetchGameRecord".format(self.lobby.get_package_name(), self.lobby.get_service_name())
+        return await _send_request(channel, method, req.SerializeToString())
+
+    @staticmethod
+    def _handle_game_record(record):
+        return convert_game_record(record)
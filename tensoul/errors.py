@@ -0,0 +1,8 @@
+class MajsoulLoginError(BaseException):
+    ...
+
+
+class MajsoulDownloadError(BaseException):
+    def __init__(self, code: int):
+        super().__init__(code)
+        self.code = code
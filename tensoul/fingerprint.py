@@ -0,0 +1,19 @@
+from functools import lru_cache
+from hashlib import sha256
+from pathlib import Path
+
+# everything deciding what a converted log looks like
+CONVERTER_SOURCES = ("converter.py", "parser.py", "model.py", "record.py", "constants.py", "utils.py", "cfg.py",
+                     "cfg.json")
+
+
+@lru_cache(maxsize=None)
+def converter_fingerprint() -> str:
+    """
+    fingerprint of the converter in use, changing whenever its code or tables change
+    """
+    h = sha256()
+    for name in CONVERTER_SOURCES:
+        h.update(name.encode("utf-8"))
+        h.update((Path(__file__).parent / name).read_bytes())
+    return h.hexdigest()[:16]
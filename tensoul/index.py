@@ -0,0 +1,276 @@
+import base64
+import json
+import sys
+from argparse import ArgumentParser
+from array import array
+from bisect import bisect_left
+from datetime import date
+from heapq import merge
+from pathlib import Path
+from typing import Iterable, Optional, Union
+
+from .cfg import cfg
+from .constants import RUNES, JPNAME
+
+# fields a game is indexed by. values of the player event fields (win, dealin, ...) are player names
+FIELDS = ("name", "dan", "rule", "ratingc", "date", "result", "yaku",
+          "win", "dealin", "yakuman_win", "yakuman_dealin", "pao")
+
+
+def _yaku_ids() -> dict[str, int]:
+    """
+    yaku name in converted logs -> id, inverting Yaku.name
+    """
+    ids = {}
+    for k, v in sorted(cfg["fan"]["fan"]["map_"].items(), key=lambda e: int(e[0])):
+        ids.setdefault(v["name_jp"], int(k))
+
+    for wind in ("east", "south", "west", "north"):
+        ids[f"{RUNES['jikaze'][JPNAME]} {RUNES[wind][JPNAME]}"] = 10
+        ids[f"{RUNES['bakaze'][JPNAME]} {RUNES[wind][JPNAME]}"] = 11
+    ids[RUNES["dabururiichi"][JPNAME]] = 18
+    return ids
+
+
+_YAKU_IDS = _yaku_ids()
+
+
+def _result_type(result: list) -> str:
+    if result[0] == RUNES["agari"][JPNAME]:
+        return "Agari"
+    elif result[0] in (RUNES["ryuukyoku"][JPNAME], RUNES["nagashimangan"][JPNAME]):
+        return "Ryukyoku"
+    else:
+        return "SpecialRyukyoku"
+
+
+def log_terms(log: dict) -> set[tuple[str, str]]:
+    """
+    (field, value) pairs a converted log is indexed by
+    """
+    terms = set()
+    names = log["name"]
+
+    for e in names:
+        terms.add(("name", e))
+    for e in log["dan"]:
+        terms.add(("dan", e))
+    terms.add(("rule", log["rule"]["disp"]))
+    terms.add(("ratingc", log["ratingc"]))
+    terms.add(("date", log["title"][1][:10]))
+
+    for kyoku in log["log"]:
+        result = kyoku[-1]
+        if not isinstance(result, (list, tuple)) or len(result) == 0 or not isinstance(result[0], str):
+            continue
+
+        terms.add(("result", _result_type(result)))
+        if result[0] != RUNES["agari"][JPNAME]:
+            continue
+
+        # ["和了", delta, [seat, ldseat, paoseat, point, yaku...], delta, [...], ...]
+        for agari in result[2::2]:
+            seat, ldseat, paoseat = agari[0], agari[1], agari[2]
+
+            yakuman = False
+            for e in agari[4:]:
+                name, _, val = e.rpartition("(")
+                yaku_id = _YAKU_IDS.get(name)
+                if yaku_id is not None:
+                    terms.add(("yaku", str(yaku_id)))
+                yakuman = yakuman or val == f"{RUNES['yakuman'][JPNAME]})"
+
+            terms.add(("win", names[seat]))
+            if yakuman:
+                terms.add(("yakuman_win", names[seat]))
+            if ldseat != seat:
+                terms.add(("dealin", names[ldseat]))
+                if yakuman:
+                    terms.add(("yakuman_dealin", names[ldseat]))
+            if paoseat != seat:
+                terms.add(("pao", names[paoseat]))
+
+    return terms
+
+
+def _intersect(lists: list[array]) -> array:
+    lists = sorted(lists, key=len)
+    result = array("I")
+    smallest, others = lists[0], lists[1:]
+    # look each id of the smallest list up in the others, every list is sorted
+    lo = [0] * len(others)
+    for doc in smallest:
+        for i, li in enumerate(others):
+            lo[i] = bisect_left(li, doc, lo[i])
+            if lo[i] == len(li) or li[lo[i]] != doc:
+                break
+        else:
+            result.append(doc)
+    return result
+
+
+def _union(lists: list[array]) -> array:
+    result = array("I")
+    for doc in merge(*lists):
+        if len(result) == 0 or result[-1] != doc:
+            result.append(doc)
+    return result
+
+
+class GameIndex:
+    """
+    inverted index over converted logs, answering queries from sorted posting lists of game ids, e.g.
+
+        index.query(name="X", yakuman_dealin="X")  # games where player X dealt into a yakuman
+        index.query(yaku=[37, 50], date_from=date(2023, 1, 1))  # daisangen or daisuushi since 2023
+    """
+
+    def __init__(self):
+        self.uuids: list[str] = []
+        self.dates = array("I")  # date.toordinal() of each game
+        self.postings: dict[str, array] = {}
+        self._ids: dict[str, int] = {}
+
+    def __len__(self):
+        return len(self.uuids)
+
+    @classmethod
+    def build(cls, logs: Iterable[dict]) -> "GameIndex":
+        index = cls()
+        for log in logs:
+            index.add(log)
+        return index
+
+    def add(self, log: dict) -> bool:
+        """
+        :return: False if the game is already indexed
+        """
+        record_uuid = log["ref"]
+        if record_uuid in self._ids:
+            return False
+
+        doc = len(self.uuids)
+        self.uuids.append(record_uuid)
+        self._ids[record_uuid] = doc
+        self.dates.append(date.fromisoformat(log["title"][1][:10]).toordinal())
+
+        # ids only grow, so appending keeps every posting list sorted
+        for field, value in log_terms(log):
+            self.postings.setdefault(f"{field}:{value}", array("I")).append(doc)
+        return True
+
+    def _postings(self, field: str, value) -> array:
+        if field not in FIELDS:
+            raise ValueError(f"unknown field: {field}")
+
+        if isinstance(value, (list, tuple, set, frozenset)):
+            return _union([self.postings.get(f"{field}:{v}", array("I")) for v in value])
+        return self.postings.get(f"{field}:{value}", array("I"))
+
+    def query(self, *, date_from: Optional[date] = None, date_to: Optional[date] = None, **fields) -> list[str]:
+        """
+        uuids of the games matching every given field, a list of values matching any of them
+
+        :param date_from: first day to include
+        :param date_to: last day to include
+        """
+        if len(fields) != 0:
+            docs = _intersect([self._postings(k, v) for k, v in fields.items()])
+        else:
+            docs = range(len(self.uuids))
+
+        lo = date_from.toordinal() if date_from is not None else 0
+        hi = date_to.toordinal() if date_to is not None else sys.maxsize
+        return [self.uuids[d] for d in docs if lo <= self.dates[d] <= hi]
+
+    def count(self, **fields) -> int:
+        return len(self.query(**fields))
+
+    def values(self, field: str) -> list[str]:
+        """
+        values of a field found in the index
+        """
+        prefix = f"{field}:"
+        return sorted(k[len(prefix):] for k in self.postings if k.startswith(prefix))
+
+    def save(self, path: Union[str, Path]):
+        def encode(a: array) -> str:
+            return base64.b64encode(a.tobytes()).decode("ascii")
+
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"uuids": self.uuids,
+                       "dates": encode(self.dates),
+                       "postings": {k: encode(v) for k, v in self.postings.items()}},
+                      f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "GameIndex":
+        def decode(s: str) -> array:
+            a = array("I")
+            a.frombytes(base64.b64decode(s))
+            return a
+
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        index = cls()
+        index.uuids = data["uuids"]
+        index._ids = {u: i for i, u in enumerate(index.uuids)}
+        index.dates = decode(data["dates"])
+        index.postings = {k: decode(v) for k, v in data["postings"].items()}
+        return index
+
+
+def _iter_json_logs(directory: Path) -> Iterable[dict]:
+    for p in sorted(directory.glob("*.json")):
+        with open(p, "r", encoding="utf-8") as f:
+            yield json.load(f)
+
+
+def main():
+    parser = ArgumentParser(description="Index converted logs and query them.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="Index converted logs.")
+    build.add_argument("source", help="Directory of converted logs, or a store made by ConvertedLogStore.")
+    build.add_argument("-o", "--output", help="Index file. (default: index.json)", dest="output",
+                       default="index.json")
+
+    query = subparsers.add_parser("query", help="Print the uuids of the games matching every condition.")
+    query.add_argument("index", help="Index file.")
+    query.add_argument("conditions", nargs="*", help=f"field=value, fields: {', '.join(FIELDS)}. "
+                                                     f"value1,value2 matches either value.")
+    query.add_argument("--from", help="First day, YYYY-MM-DD.", dest="date_from", type=date.fromisoformat)
+    query.add_argument("--to", help="Last day, YYYY-MM-DD.", dest="date_to", type=date.fromisoformat)
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        source = Path(args.source)
+        if source.is_dir():
+            index = GameIndex.build(_iter_json_logs(source))
+        else:
+            from .store import ConvertedLogStore
+            with ConvertedLogStore(source) as store:
+                index = GameIndex.build(store.iter_logs())
+        index.save(args.output)
+        print(f"{len(index)} games indexed", file=sys.stderr)
+    else:
+        fields = {}
+        for cond in args.conditions:
+            field, sep, value = cond.partition("=")
+            if not sep:
+                parser.error(f"invalid condition: {cond}")
+            fields[field] = value.split(",") if "," in value else value
+
+        index = GameIndex.load(args.index)
+        try:
+            uuids = index.query(date_from=args.date_from, date_to=args.date_to, **fields)
+        except ValueError as e:
+            parser.error(str(e))
+        for u in uuids:
+            print(u)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import asyncio
+from typing import AsyncIterable, AsyncIterator, Optional
+
+import ms.protocol_pb2 as pb
+
+from .model import Kyoku
+from .parser import MajsoulPaipuParser
+from .record import decode_message, iter_wrapped_records
+
+
+def _is_repeated(field) -> bool:
+    if hasattr(field, "is_repeated"):
+        return field.is_repeated
+    return field.label == field.LABEL_REPEATED
+
+
+def action_to_record(action, seat: Optional[int] = None):
+    """
+    convert a live Action* message (ActionDiscardTile, ...) into its Record* counterpart (RecordDiscardTile, ...)
+    by copying the fields they have in common.
+
+    :param seat: seat of the player whose hand ActionNewRound.tiles is
+    """
+    record_type = getattr(pb, "Record" + action.DESCRIPTOR.name[len("Action"):], None)
+    if record_type is None:
+        return action
+
+    record = record_type()
+    fields = record.DESCRIPTOR.fields_by_name
+    for field, value in action.ListFields():
+        target = fields.get(field.name)
+        if target is None and field.name == "tiles" and seat is not None and isinstance(record, pb.RecordNewRound):
+            target = fields[f"tiles{seat}"]
+
+        if target is None or target.type != field.type or _is_repeated(target) != _is_repeated(field):
+            continue
+        if field.message_type is not None and field.message_type.full_name != target.message_type.full_name:
+            continue
+
+        if _is_repeated(field):
+            if field.message_type is not None:
+                for v in value:
+                    getattr(record, target.name).add().CopyFrom(v)
+            else:
+                getattr(record, target.name).extend(value)
+        elif field.message_type is not None:
+            getattr(record, target.name).CopyFrom(value)
+        else:
+            setattr(record, target.name, value)
+
+    return record
+
+
+class MajsoulLiveParser:
+    """
+    convert an in-progress game record by record, handing out each kyoku in tenhou.net/6 format as soon as it closes.
+
+    accepts both Record* messages (from game records or replays) and Action* messages (from spectating
+    or action notifications). when other players' tiles are hidden, their haipai and draws are left out of
+    the kyoku and their seats are listed in unknown_seats.
+    """
+
+    def __init__(self, *, tsumoloss_off: bool = False, seat: Optional[int] = None):
+        self._parser = MajsoulPaipuParser(tsumoloss_off=tsumoloss_off)
+        self._emitted = 0
+        self.seat = seat
+        self.unknown_seats: set[int] = set()  # seats of the current (or last closed) kyoku with hidden tiles
+
+    def feed(self, log) -> list:
+        """
+        :return: the kyokus closed by this record, dumped. usually empty
+        """
+        if log.DESCRIPTOR.name.startswith("Action"):
+            log = action_to_record(log, self.seat)
+
+        name = log.DESCRIPTOR.name
+        if name == "RecordNewRound":
+            self.unknown_seats = {i for i in range(len(log.scores)) if len(getattr(log, f"tiles{i}")) == 0}
+        elif name == "RecordDealTile" and not log.tile:
+            self.unknown_seats.add(log.seat)
+        elif name == "RecordDiscardTile" and not log.tile:
+            raise ValueError(f"RecordDiscardTile of seat {log.seat} has no tile, can't convert a hidden discard")
+
+        self._parser.feed(log)
+
+        kyokus = self._parser.getvalue()
+        if len(kyokus) == self._emitted:
+            return []
+
+        closed = [e.dump() for e in kyokus[self._emitted:]]
+        self._emitted = len(kyokus)
+        return closed
+
+    def feed_wrapped(self, name: str, data: bytes) -> list:
+        """
+        feed a serialized message, e.g. Wrapper.name/Wrapper.data or ActionPrototype.name/ActionPrototype.data
+        """
+        return self.feed(decode_message(name, data))
+
+    def getvalue(self) -> list[Kyoku]:
+        return self._parser.getvalue()
+
+
+async def convert_live(actions: AsyncIterable[tuple[str, bytes]], *,
+                       tsumoloss_off: bool = False, seat: Optional[int] = None) -> AsyncIterator[list]:
+    """
+    consume a stream of (name, data) messages, yielding each kyoku in tenhou.net/6 format as soon as it closes
+    """
+    parser = MajsoulLiveParser(tsumoloss_off=tsumoloss_off, seat=seat)
+    async for name, data in actions:
+        for kyoku in parser.feed_wrapped(name, data):
+            yield kyoku
+
+
+async def replay_game_record(record, *, interval: float = 0.0) -> AsyncIterator[tuple[str, bytes]]:
+    """
+    replay a finished ResGameRecord as a stream of (name, data) messages, standing in for a live feed
+
+    :param interval: seconds to wait between messages
+    """
+    for wrapped in iter_wrapped_records(record.data):
+        wrapper = pb.Wrapper()
+        wrapper.ParseFromString(wrapped)
+        yield wrapper.name, wrapper.data
+
+        if interval > 0:
+            await asyncio.sleep(interval)
@@ -0,0 +1,272 @@
+from typing import Iterable, Iterator, Optional, Sequence
+
+from .record import iter_records
+from .utils import pad_list
+
+_WINDS = ["E", "S", "W", "N"]
+_HONORS = ["E", "S", "W", "N", "P", "F", "C"]
+
+
+def mjai_tile(tile: str) -> str:
+    """
+    majsoul tile to mjai tile: "3m" -> "3m", "0p" -> "5pr", "5z" -> "P"
+    """
+    num, suit = tile[0], tile[1]
+    if suit == "z":
+        return _HONORS[int(num) - 1]
+    if num == "0":
+        return f"5{suit}r"
+    return tile
+
+
+def _deaka(tile: str) -> str:
+    if tile[0] == "0" and tile[1] != "z":
+        return f"5{tile[1]}"
+    return tile
+
+
+class MajsoulMjaiExporter:
+    """
+    turn the round records of a game directly into mjai events, one record at a time,
+    without building Kyoku objects
+    """
+
+    def __init__(self):
+        self.nplayers = 4
+        self.scores = [0] * 4
+        self.kyotaku = 0
+        self.honba = 0
+        self.ndoras = 0
+        self.dealer = 0
+        self.poppedtile = None
+        self.ndiscards = [0] * 4
+        self.ldseat = -1  # who dealt the last tile
+        self.last_tile = None  # last tile drawn, discarded or added to a kan
+        self.pending_reach = -1  # seat whose riichi is waiting to be accepted
+        self.pons = [{} for _ in range(4)]  # de-aka'd pon tile -> pon tiles, for kakan
+
+    def feed(self, log) -> Iterator[dict]:
+        name = log.DESCRIPTOR.name
+        if name == "RecordNewRound":
+            yield from self._handle_new_round(log)
+        elif name == "RecordDiscardTile":
+            yield from self._handle_discard_tile(log)
+        elif name == "RecordDealTile":
+            yield from self._handle_deal_tile(log)
+        elif name == "RecordChiPengGang":
+            yield from self._handle_chi_peng_gang(log)
+        elif name == "RecordAnGangAddGang":
+            yield from self._handle_an_gang_add_gang(log)
+        elif name == "RecordBaBei":
+            yield from self._handle_ba_bei(log)
+        elif name == "RecordLiuJu":
+            yield from self._handle_liu_ju(log)
+        elif name == "RecordNoTile":
+            yield from self._handle_no_tile(log)
+        elif name == "RecordHule":
+            yield from self._handle_hu_le(log)
+
+    def _accept_reach(self) -> Iterator[dict]:
+        if self.pending_reach != -1:
+            actor = self.pending_reach
+            self.pending_reach = -1
+
+            deltas = [0] * 4
+            deltas[actor] = -1000
+            self.scores[actor] -= 1000
+            self.kyotaku += 1
+            yield {"type": "reach_accepted", "actor": actor, "deltas": deltas, "scores": list(self.scores)}
+
+    def _new_doras(self, doras: Sequence[str]) -> Iterator[dict]:
+        for t in doras[self.ndoras:]:
+            yield {"type": "dora", "dora_marker": mjai_tile(t)}
+        self.ndoras = max(self.ndoras, len(doras))
+
+    def _handle_new_round(self, log) -> Iterator[dict]:
+        self.nplayers = len(log.scores)
+        self.scores = pad_list(list(log.scores), 4, 0)
+        self.kyotaku = log.liqibang
+        self.honba = log.ben
+        self.dealer = log.ju
+        self.ndiscards = [0] * 4
+        self.ldseat = -1
+        self.pending_reach = -1
+        self.pons = [{} for _ in range(4)]
+
+        doras = [log.dora] if log.dora else list(log.doras)
+        self.ndoras = len(doras)
+
+        tehais = []
+        for i in range(4):
+            tiles = [mjai_tile(t) for t in getattr(log, f"tiles{i}")]
+            # absent seat of sanma
+            tehais.append(tiles if len(tiles) != 0 else ["?"] * 13)
+
+        # the dealer's 14th tile is its first tsumo
+        self.poppedtile = None
+        if len(tehais[log.ju]) == 14:
+            self.poppedtile = getattr(log, f"tiles{log.ju}")[-1]
+            tehais[log.ju].pop()
+
+        yield {"type": "start_kyoku", "bakaze": _WINDS[log.chang], "kyoku": log.ju + 1, "honba": log.ben,
+               "kyotaku": log.liqibang, "oya": log.ju, "dora_marker": mjai_tile(doras[0]),
+               "scores": list(self.scores), "tehais": tehais}
+
+        self.last_tile = self.poppedtile
+        if self.poppedtile is not None:
+            yield {"type": "tsumo", "actor": log.ju, "pai": mjai_tile(self.poppedtile)}
+
+    def _handle_discard_tile(self, log) -> Iterator[dict]:
+        tsumogiri = log.moqie
+        # 特判庄家第一张的手摸切
+        if log.seat == self.dealer and self.ndiscards[log.seat] == 0 and log.tile == self.poppedtile:
+            tsumogiri = True
+
+        if log.is_liqi:
+            yield {"type": "reach", "actor": log.seat}
+            self.pending_reach = log.seat
+
+        yield {"type": "dahai", "actor": log.seat, "pai": mjai_tile(log.tile), "tsumogiri": tsumogiri}
+        self.ndiscards[log.seat] += 1
+        self.ldseat = log.seat
+        self.last_tile = log.tile
+
+        yield from self._new_doras(log.doras)
+
+    def _handle_deal_tile(self, log) -> Iterator[dict]:
+        yield from self._accept_reach()
+        yield from self._new_doras(log.doras)
+        yield {"type": "tsumo", "actor": log.seat, "pai": mjai_tile(log.tile)}
+        self.last_tile = log.tile
+
+    def _handle_chi_peng_gang(self, log) -> Iterator[dict]:
+        yield from self._accept_reach()
+
+        if log.type == 0:
+            typ = "chi"
+        elif log.type == 1:
+            typ = "pon"
+        elif log.type == 2:
+            typ = "daiminkan"
+        else:
+            raise RuntimeError(f"invalid RecordChiPengGang.type={log.type}")
+
+        consumed = []
+        pai = None
+        target = self.ldseat
+        for i, t in enumerate(log.tiles):
+            if i < len(log.froms) and log.froms[i] != log.seat:
+                pai = t
+                target = log.froms[i]
+            else:
+                consumed.append(t)
+        if pai is None:
+            # called tile comes last
+            pai = consumed.pop()
+
+        if log.type == 1:
+            self.pons[log.seat][_deaka(pai)] = list(log.tiles)
+
+        yield {"type": typ, "actor": log.seat, "target": target, "pai": mjai_tile(pai),
+               "consumed": [mjai_tile(t) for t in consumed]}
+
+    def _handle_an_gang_add_gang(self, log) -> Iterator[dict]:
+        tile = log.tiles
+        self.ldseat = log.seat
+        self.last_tile = tile
+
+        if log.type == 3:
+            normal = _deaka(tile)
+            consumed = [normal] * 4
+            if normal[0] == "5" and normal[1] != "z":
+                consumed[0] = f"0{normal[1]}"
+            yield {"type": "ankan", "actor": log.seat, "consumed": [mjai_tile(t) for t in consumed]}
+        elif log.type == 2:
+            consumed = self.pons[log.seat].pop(_deaka(tile), [_deaka(tile)] * 3)
+            yield {"type": "kakan", "actor": log.seat, "pai": mjai_tile(tile),
+                   "consumed": [mjai_tile(t) for t in consumed]}
+        else:
+            raise RuntimeError(f"invalid RecordAnGangAddGang.type={log.type}")
+
+        yield from self._new_doras(log.doras)
+
+    def _handle_ba_bei(self, log) -> Iterator[dict]:
+        yield {"type": "nukidora", "actor": log.seat, "pai": "N"}
+        yield from self._new_doras(log.doras)
+
+    def _end_kyoku(self) -> Iterator[dict]:
+        yield {"type": "end_kyoku"}
+
+    def _handle_liu_ju(self, log) -> Iterator[dict]:
+        yield from self._accept_reach()
+        yield {"type": "ryukyoku", "deltas": [0] * 4, "scores": list(self.scores)}
+        yield from self._end_kyoku()
+
+    def _handle_no_tile(self, log) -> Iterator[dict]:
+        deltas = [0] * 4
+        if len(log.scores) != 0 and len(log.scores[0].delta_scores) != 0:
+            for score in log.scores:
+                for i, g in enumerate(score.delta_scores):
+                    deltas[i] += g
+
+        self._apply(deltas)
+        yield {"type": "ryukyoku", "deltas": deltas, "scores": list(self.scores)}
+        yield from self._end_kyoku()
+
+    def _apply(self, deltas: Sequence[int]):
+        for i, d in enumerate(deltas):
+            self.scores[i] += d
+
+    def _handle_hu_le(self, log) -> Iterator[dict]:
+        total = pad_list(list(log.delta_scores), 4, 0)
+
+        # mjai wants the deltas of each hora. with double ron, the first winner takes the honba and
+        # the sticks, and whatever pao moved is left to the last one so the sum still matches
+        sticks = 1000 * self.kyotaku
+        honba = 100 * self.honba
+        remain = list(total)
+
+        for i, hule in enumerate(log.hules):
+            target = hule.seat if hule.zimo else self.ldseat
+
+            if i == len(log.hules) - 1:
+                deltas = remain
+            else:
+                deltas = [0] * 4
+                deltas[hule.seat] = hule.point_rong + sticks + (self.nplayers - 1) * honba
+                deltas[target] = -hule.point_rong - (self.nplayers - 1) * honba
+                sticks = 0
+                honba = 0
+                remain = [r - d for r, d in zip(remain, deltas)]
+
+            self._apply(deltas)
+            yield {"type": "hora", "actor": hule.seat, "target": target, "pai": mjai_tile(hule.hu_tile or self.last_tile),
+                   "uradora_markers": [mjai_tile(t) for t in hule.li_doras],
+                   "deltas": list(deltas), "scores": list(self.scores)}
+
+        self.kyotaku = 0
+        yield from self._end_kyoku()
+
+
+def iter_mjai_events(records: Iterable, names: Optional[Sequence[str]] = None) -> Iterator[dict]:
+    """
+    mjai events of a game, from start_game to end_game, given its decoded round records
+    """
+    yield {"type": "start_game", "names": pad_list(list(names) if names is not None else ["AI"] * 4, 4, "")}
+
+    exporter = MajsoulMjaiExporter()
+    for log in records:
+        yield from exporter.feed(log)
+
+    yield {"type": "end_game"}
+
+
+def game_record_to_mjai(record) -> Iterator[dict]:
+    """
+    mjai events of a ResGameRecord
+    """
+    names = ["AI"] * len(record.head.result.players)
+    for e in record.head.accounts:
+        names[e.seat] = e.nickname
+
+    return iter_mjai_events(iter_records(record.data), names)
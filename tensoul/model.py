@@ -62,6 +62,12 @@ class Tile(NamedTuple):
         return self
 
 
+# majsoul tile -> tenhou code, for encoding without building Tile objects
+TENHOU_TILE_CODES = {f"{n}{t}": Tile(n, TileType[t.upper()]).encode_tenhou()
+                     for t in "mps" for n in range(10)}
+TENHOU_TILE_CODES.update({f"{n}z": Tile(n, TileType.Z).encode_tenhou() for n in range(1, 8)})
+
+
 class DiscardSymbol(NamedTuple):
     tile: Tile
     tsumogiri: bool = False
@@ -383,3 +389,43 @@ class Kyoku:
             entry.append(self.result.dump())
 
         return entry
+
+
+@dataclass
+class EncodedKyoku:
+    """
+    kyoku whose tiles and symbols are already in tenhou encoding, dumping the same entry as Kyoku
+    """
+    nplayers: int
+
+    round: Round
+
+    initscores: list[int]
+
+    doras: list[int]
+
+    draws: list[list[Union[int, str]]]
+
+    discards: list[list[Union[int, str]]]
+
+    haipais: list[list[int]]
+
+    result: Optional[KyokuResult] = None
+
+    def dump(self):
+        entry = [self.round, self.initscores, self.doras]
+
+        if isinstance(self.result, Agari):
+            entry.append([t.encode_tenhou() for t in self.result.uras])
+        else:
+            entry.append([])
+
+        for i in range(self.nplayers):
+            entry.append(self.haipais[i])
+            entry.append(self.draws[i])
+            entry.append(self.discards[i])
+
+        if self.result is not None:
+            entry.append(self.result.dump())
+
+        return entry
@@ -1,40 +1,57 @@
 from math import ceil
 from typing import List
 
-import ms.protocol_pb2 as pb
-
-from .constants import DAISUUSHI, DAISANGEN, YSCORE
+from .constants import DAISUUSHI, DAISANGEN, YSCORE, TSUMOGIRI
 from .model import Kyoku, Round, Tile, DiscardSymbol, ChiSymbol, TileType, PonSymbol, DaiminkanSymbol, \
-    ZeroSymbol, AnkanSymbol, KakanSymbol, SpecialRyukyoku, Ryukyoku, Agari, SingleAgari, PeSymbol, AgariPoint, Yaku
+    ZeroSymbol, AnkanSymbol, KakanSymbol, SpecialRyukyoku, Ryukyoku, Agari, SingleAgari, PeSymbol, AgariPoint, Yaku, \
+    EncodedKyoku, TENHOU_TILE_CODES
 from .utils import pad_list, relative_seating
 
+# tenhou code of an aka -> its normal tile
+_DEAKA_CODES = {51: 15, 52: 25, 53: 35}
+
 
 class MajsoulPaipuParser:
-    def __init__(self, *, tsumoloss_off: bool = False, allow_kigiage: bool = False):
+    def __init__(self, *, tsumoloss_off: bool = False, allow_kigiage: bool = False, fast_encode: bool = False):
+        """
+        :param fast_encode: write tenhou codes straight into the kyokus as records are fed, instead of building
+                            Tile and symbol objects to encode on dump. getvalue() then gives EncodedKyoku,
+                            dumping the same entries
+        """
         self.kyokus = []
 
         self.tsumoloss_off = tsumoloss_off
         self.allow_kigiage = allow_kigiage
+        self._handlers = self._ENCODE_HANDLERS if fast_encode else self._HANDLERS
+
+    # dispatch on the protobuf type name, so the parser doesn't have to import ms.protocol_pb2
+    _HANDLERS = {
+        "RecordNewRound": "_handle_new_round",
+        "RecordDiscardTile": "_handle_discard_tile",
+        "RecordDealTile": "_handle_deal_tile",
+        "RecordChiPengGang": "_handle_chi_peng_gang",
+        "RecordAnGangAddGang": "_handle_an_gang_add_gang",
+        "RecordBaBei": "_handle_ba_bei",
+        "RecordLiuJu": "_handle_liu_ju",
+        "RecordNoTile": "_handle_no_tile",
+        "RecordHule": "_handle_hu_le",
+    }
+
+    # fast_encode only swaps the handlers of the records building the hands, results are shared
+    _ENCODE_HANDLERS = {
+        **_HANDLERS,
+        "RecordNewRound": "_encode_new_round",
+        "RecordDiscardTile": "_encode_discard_tile",
+        "RecordDealTile": "_encode_deal_tile",
+        "RecordChiPengGang": "_encode_chi_peng_gang",
+        "RecordAnGangAddGang": "_encode_an_gang_add_gang",
+        "RecordBaBei": "_encode_ba_bei",
+    }
 
     def feed(self, log):
-        if isinstance(log, pb.RecordNewRound):
-            self._handle_new_round(log)
-        elif isinstance(log, pb.RecordDiscardTile):
-            self._handle_discard_tile(log)
-        elif isinstance(log, pb.RecordDealTile):
-            self._handle_deal_tile(log)
-        elif isinstance(log, pb.RecordChiPengGang):
-            self._handle_chi_peng_gang(log)
-        elif isinstance(log, pb.RecordAnGangAddGang):
-            self._handle_an_gang_add_gang(log)
-        elif isinstance(log, pb.RecordBaBei):
-            self._handle_ba_bei(log)
-        elif isinstance(log, pb.RecordLiuJu):
-            self._handle_liu_ju(log)
-        elif isinstance(log, pb.RecordNoTile):
-            self._handle_no_tile(log)
-        elif isinstance(log, pb.RecordHule):
-            self._handle_hu_le(log)
+        handler = self._handlers.get(log.DESCRIPTOR.name)
+        if handler is not None:
+            getattr(self, handler)(log)
 
     def _handle_new_round(self, log):
         self.cur = Kyoku(nplayers=len(log.scores),
@@ -47,9 +64,14 @@ class MajsoulPaipuParser:
                          )
 
         # 转换为庄家摸13张牌的形式
-        self.poppedtile = self.cur.haipais[log.ju].pop()
-        self.cur.draws[log.ju].append(self.poppedtile)
+        self.poppedtile = None
+        if len(self.cur.haipais[log.ju]) == 14:
+            self.poppedtile = self.cur.haipais[log.ju].pop()
+            self.cur.draws[log.ju].append(self.poppedtile)
+
+        self._reset_round_state(log)
 
+    def _reset_round_state(self, log):
         # information we need, but can 't expect in every record
         self.dealerseat = log.ju
         self.ldseat = -1  # who dealt the last tile
@@ -97,7 +119,9 @@ class MajsoulPaipuParser:
         if len(log.doras) > len(self.cur.doras):
             self.cur.doras = [Tile.parse(t) for t in log.doras]
 
-        self.cur.draws[log.seat].append(Tile.parse(log.tile))
+        # another player's draw seen while spectating has no tile, there is nothing to write
+        if log.tile:
+            self.cur.draws[log.seat].append(Tile.parse(log.tile))
 
     def _countpao(self, tile: Tile, owner: int, feeder: int):
         if tile.type != TileType.Z:
@@ -161,6 +185,129 @@ class MajsoulPaipuParser:
         # kita - this record (only) gives {seat, moqie}
         self.cur.discards[log.seat].append(PeSymbol())
 
+    def _encode_new_round(self, log):
+        self.cur = EncodedKyoku(nplayers=len(log.scores),
+                                round=Round(4 * log.chang + log.ju, log.ben, log.liqibang),
+                                initscores=pad_list(list(log.scores), 4, 0),
+                                doras=[TENHOU_TILE_CODES[log.dora]] if log.dora else
+                                [TENHOU_TILE_CODES[t] for t in log.doras],
+                                draws=[[] for i in range(4)],
+                                discards=[[] for i in range(4)],
+                                haipais=[[TENHOU_TILE_CODES[t] for t in getattr(log, f"tiles{i}")] for i in range(4)]
+                                )
+
+        # 转换为庄家摸13张牌的形式
+        self.poppedtile = None
+        if len(self.cur.haipais[log.ju]) == 14:
+            self.poppedtile = self.cur.haipais[log.ju].pop()
+            self.cur.draws[log.ju].append(self.poppedtile)
+
+        self._reset_round_state(log)
+        self.pons = [{} for i in range(4)]  # de-aka'd tile -> (a, b, tile, feeder_relative) of each pon, for kakan
+
+    def _encode_discard_tile(self, log):
+        tile = TENHOU_TILE_CODES[log.tile]
+
+        tsumogiri = log.moqie
+        # 特判庄家第一张的手摸切
+        if log.seat == self.dealerseat and len(self.cur.discards[log.seat]) == 0 and tile == self.poppedtile:
+            tsumogiri = True
+
+        code = TSUMOGIRI if tsumogiri else tile
+
+        # 立直宣言
+        if log.is_liqi:
+            self.priichi = True
+            code = f"r{code}"
+
+        self.cur.discards[log.seat].append(code)
+        self.ldseat = log.seat
+
+        # 更新dora
+        if len(log.doras) > len(self.cur.doras):
+            self.cur.doras = [TENHOU_TILE_CODES[t] for t in log.doras]
+
+    def _encode_deal_tile(self, log):
+        self._accept_riichi()
+
+        # 更新dora
+        if len(log.doras) > len(self.cur.doras):
+            self.cur.doras = [TENHOU_TILE_CODES[t] for t in log.doras]
+
+        # another player's draw seen while spectating has no tile, there is nothing to write
+        if log.tile:
+            self.cur.draws[log.seat].append(TENHOU_TILE_CODES[log.tile])
+
+    def _countpao_code(self, tile: int, owner: int, feeder: int):
+        # same as _countpao, on a tenhou code: 41-44 winds, 45-47 dragons
+        if 41 <= tile <= 44:
+            self.nowinds[owner] += 1
+            if self.nowinds[owner] == 4:
+                self.paowind = feeder
+        elif 45 <= tile <= 47:
+            self.nodrags[owner] += 1
+            if self.nodrags[owner] == 3:
+                self.paodrag = feeder
+
+    def _encode_chi_peng_gang(self, log):
+        self._accept_riichi()
+
+        tiles = [TENHOU_TILE_CODES[t] for t in log.tiles]
+        if log.type == 0:
+            # chi
+            self.cur.draws[log.seat].append(f"c{tiles[2]}{tiles[0]}{tiles[1]}")
+        elif log.type == 1:
+            # pon
+            idx = relative_seating(log.seat, self.ldseat)
+            self._countpao_code(tiles[0], log.seat, self.ldseat)
+            self.pons[log.seat].setdefault(_DEAKA_CODES.get(tiles[2], tiles[2]), (tiles[0], tiles[1], tiles[2], idx))
+
+            t = [str(tiles[0]), str(tiles[1])]
+            t.insert(idx, f"p{tiles[2]}")
+            self.cur.draws[log.seat].append("".join(t))
+        elif log.type == 2:
+            # daiminkan
+            idx = relative_seating(log.seat, self.ldseat)
+            self._countpao_code(tiles[0], log.seat, self.ldseat)
+
+            t = [str(tiles[0]), str(tiles[1]), str(tiles[2])]
+            t.insert(3 if idx == 2 else idx, f"m{tiles[3]}")
+            self.cur.draws[log.seat].append("".join(t))
+            self.cur.discards[log.seat].append(0)  # tenhou drops a 0 in discards for this
+            self.nkan += 1
+        else:
+            raise RuntimeError(f"invalid RecordChiPengGang.type={log.type}")
+
+    def _encode_an_gang_add_gang(self, log):
+        # NOTE: e.tiles here is a single tile; naki is placed in discards
+        tile = TENHOU_TILE_CODES[log.tiles]
+        normal = _DEAKA_CODES.get(tile, tile)
+        self.ldseat = log.seat
+
+        if log.type == 3:
+            # ankan
+            self._countpao_code(normal, log.seat, -1)  # count the group as visible, but don't set pao
+            if normal in (15, 25, 35):
+                self.cur.discards[log.seat].append(f"{50 + normal // 10}{normal}{normal}a{normal}")
+            else:
+                self.cur.discards[log.seat].append(f"{normal}{normal}{normal}a{normal}")
+            self.nkan += 1
+        elif log.type == 2:
+            # kakan
+            pon = self.pons[log.seat].get(normal)
+            if pon is not None:
+                a, b, called, idx = pon
+                t = [str(a), str(b), str(called)]
+                t.insert(idx, f"k{tile}")
+                self.cur.discards[log.seat].append("".join(t))
+                self.nkan += 1
+        else:
+            raise RuntimeError(f"invalid RecordAnGangAddGang.type={log.type}")
+
+    def _encode_ba_bei(self, log):
+        # kita - this record (only) gives {seat, moqie}
+        self.cur.discards[log.seat].append("f44")
+
     def _handle_liu_ju(self, log):
         self._accept_riichi()
 
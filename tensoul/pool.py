@@ -0,0 +1,161 @@
+import asyncio
+import time
+from collections import deque
+from typing import NamedTuple, Iterable, Optional, Collection
+
+from .cache import LRUCache, SingleFlight
+from .downloader import MajsoulPaipuDownloader, MajsoulDownloadError
+
+
+class MajsoulAccount(NamedTuple):
+    username: str
+    password: str
+
+
+class _AccountSlot:
+    def __init__(self, account: MajsoulAccount, downloader: MajsoulPaipuDownloader):
+        self.account = account
+        self.downloader = downloader
+        self.history = deque()  # monotonic timestamps of requests sent in the current period
+        self.parked_until = 0.0
+        self.running = 0
+
+    def available_at(self, now: float, budget: int, period: float) -> float:
+        """
+        earliest time this account may send another request
+        """
+        while len(self.history) != 0 and self.history[0] <= now - period:
+            self.history.popleft()
+
+        at = self.parked_until
+        if len(self.history) >= budget:
+            at = max(at, self.history[0] + period)
+        return at
+
+
+class MajsoulPaipuDownloaderPool:
+    """
+    spread downloads over several accounts, each with its own channel, login token and request budget.
+
+    an account is parked for park_duration seconds once the server answers with one of rate_limit_codes.
+    """
+
+    def __init__(self, accounts: Iterable[MajsoulAccount], *,
+                 rate_limit_codes: Collection[int],
+                 budget: int = 20,
+                 period: float = 60.0,
+                 park_duration: float = 300.0,
+                 max_retries: Optional[int] = None,
+                 cache: Optional[LRUCache] = None,
+                 timeout: Optional[float] = None,
+                 **kwargs):
+        """
+        :param rate_limit_codes: MajsoulDownloadError codes meaning "too many requests". the server doesn't
+                                 document them, so there is no default
+        :param max_retries: accounts to try again on after a rate limit. defaults to every other account
+        :param timeout: default deadline in seconds of download()
+        :param kwargs: passed to MajsoulPaipuDownloader of every account
+        """
+        self.accounts = [MajsoulAccount(*a) for a in accounts]
+        if len(self.accounts) == 0:
+            raise ValueError("at least one account is required")
+
+        self.budget = budget
+        self.period = period
+        self.park_duration = park_duration
+        self.rate_limit_codes = frozenset(rate_limit_codes)
+        # by default, give every account one chance before giving up on a record
+        self.max_retries = max_retries if max_retries is not None else len(self.accounts) - 1
+
+        self.cache = cache
+        self.timeout = timeout
+        self.downloader_kwargs = kwargs
+        self._inflight = SingleFlight()
+
+        self._slots: list[_AccountSlot] = []
+
+    async def start(self):
+        slots = [_AccountSlot(a, MajsoulPaipuDownloader(**self.downloader_kwargs)) for a in self.accounts]
+        results = await asyncio.gather(*[self._start_slot(slot) for slot in slots], return_exceptions=True)
+
+        errors = [e for e in results if isinstance(e, BaseException)]
+        if len(errors) != 0:
+            # __aexit__ won't run, don't leave the accounts that did log in connected
+            await asyncio.gather(*[slot.downloader.close() for slot in slots], return_exceptions=True)
+            raise errors[0]
+
+        self._slots = slots
+
+    @staticmethod
+    async def _start_slot(slot: _AccountSlot):
+        await slot.downloader.start()
+        await slot.downloader.login(slot.account.username, slot.account.password)
+
+    async def close(self):
+        await asyncio.gather(*[slot.downloader.close() for slot in self._slots])
+        self._slots = []
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def _acquire(self) -> _AccountSlot:
+        while True:
+            now = time.monotonic()
+
+            best = None
+            best_key = None
+            for slot in self._slots:
+                # prefer accounts available soonest, then the least busy, then the one with most budget left
+                key = (max(slot.available_at(now, self.budget, self.period), now), slot.running, len(slot.history))
+                if best is None or key < best_key:
+                    best, best_key = slot, key
+
+            if best_key[0] <= now:
+                best.history.append(now)
+                best.running += 1
+                return best
+
+            await asyncio.sleep(best_key[0] - now)
+
+    def _park(self, slot: _AccountSlot):
+        slot.parked_until = time.monotonic() + self.park_duration
+
+    async def download(self, record_uuid: str, *, timeout: Optional[float] = None):
+        if self.cache is not None:
+            res = self.cache.get(record_uuid)
+            if res is not None:
+                return res
+
+        if timeout is None:
+            timeout = self.timeout
+
+        # the accounts get the deadline of the caller starting the download. once every caller has given up,
+        # the download is cancelled, releasing its account
+        deadline = asyncio.get_running_loop().time() + timeout if timeout is not None else None
+        return await asyncio.wait_for(self._inflight.do(record_uuid, lambda: self._download(record_uuid, deadline)),
+                                      timeout)
+
+    async def _download(self, record_uuid: str, deadline: Optional[float] = None):
+        retries = 0
+        while True:
+            slot = await self._acquire()
+            try:
+                timeout = max(deadline - asyncio.get_running_loop().time(), 0) if deadline is not None else None
+                res = await slot.downloader.download(record_uuid, timeout=timeout)
+                if self.cache is not None:
+                    self.cache.put(record_uuid, res)
+                return res
+            except MajsoulDownloadError as e:
+                if e.code not in self.rate_limit_codes:
+                    raise
+
+                self._park(slot)
+                retries += 1
+                if retries > self.max_retries:
+                    raise
+            finally:
+                slot.running -= 1
@@ -0,0 +1,79 @@
+from typing import Iterator
+
+import ms.protocol_pb2 as pb
+
+
+def short_name(name: str) -> str:
+    """
+    ".lq.RecordNewRound" -> "RecordNewRound"
+    """
+    if name.startswith(".lq."):
+        return name[len(".lq."):]
+    return name
+
+
+def decode_message(name: str, data: bytes):
+    """
+    decode a message by its protobuf type name, e.g. ".lq.RecordNewRound" or "RecordNewRound"
+    """
+    msg = getattr(pb, short_name(name))()
+    msg.ParseFromString(data)
+    return msg
+
+
+def decode_wrapper(wrapped: bytes):
+    wrapper = pb.Wrapper()
+    wrapper.ParseFromString(wrapped)
+    return decode_message(wrapper.name, wrapper.data)
+
+
+# records closing a kyoku
+KYOKU_END_RECORDS = frozenset(("RecordHule", "RecordNoTile", "RecordLiuJu"))
+
+
+def iter_wrapped_records(data: bytes) -> Iterator[bytes]:
+    """
+    iterate over the wrapped round records (still serialized) from ResGameRecord.data
+    """
+    details = decode_wrapper(data)
+
+    if details.version < 210715 and len(details.records) > 0:
+        yield from details.records
+    else:
+        for act in details.actions:
+            if len(act.result) != 0:
+                yield act.result
+
+
+def iter_records(data: bytes) -> Iterator:
+    """
+    iterate over the decoded round records (RecordNewRound, RecordDiscardTile, ...) from ResGameRecord.data
+    """
+    for wrapped in iter_wrapped_records(data):
+        yield decode_wrapper(wrapped)
+
+
+def split_kyokus(data: bytes) -> list[list[tuple[str, bytes]]]:
+    """
+    split the round records from ResGameRecord.data into kyokus at each RecordNewRound, as (name, data) pairs
+    still to decode. unfinished kyokus are left out, as the parser leaves them out of its output
+    """
+    kyokus = []
+    cur = None
+
+    wrapper = pb.Wrapper()
+    for wrapped in iter_wrapped_records(data):
+        wrapper.ParseFromString(wrapped)
+        name = short_name(wrapper.name)
+
+        if name == "RecordNewRound":
+            cur = []
+        if cur is None:
+            continue
+
+        cur.append((name, wrapper.data))
+        if name in KYOKU_END_RECORDS:
+            kyokus.append(cur)
+            cur = None
+
+    return kyokus
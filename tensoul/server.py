@@ -0,0 +1,170 @@
+import asyncio
+import json
+import os
+import re
+import sys
+from argparse import ArgumentParser
+from typing import Optional, Iterator
+
+from aiohttp import web
+from websockets.exceptions import ConnectionClosed
+
+from .cache import LRUCache, SingleFlight
+from .downloader import MajsoulPaipuDownloader, MajsoulDownloadError
+
+RECORD_UUID_PATTERN = re.compile(r"^[0-9A-Za-z_-]{1,128}$")
+
+
+class MajsoulPaipuServer:
+    """
+    keep a logged-in downloader warm and serve GET /paipu/<uuid> as tenhou.net/6 json
+    """
+
+    def __init__(self, username: str, password: str, *,
+                 max_concurrency: int = 8,
+                 cache_size: int = 1024,
+                 cache_bytes: Optional[int] = 256 * 1024 * 1024,
+                 cache_ttl: Optional[float] = 3600,
+                 timeout: Optional[float] = 30):
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+
+        self.downloader: Optional[MajsoulPaipuDownloader] = None
+        # encoded responses, so a cache hit costs no serialization
+        self.cache = LRUCache(cache_size, max_bytes=cache_bytes, ttl=cache_ttl, sizeof=len)
+        self._inflight = SingleFlight()
+        self.max_concurrency = max_concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._reconnecting: Optional[asyncio.Task] = None
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/paipu/{uuid}", self.handle_paipu)
+        app.on_startup.append(self._on_startup)
+        app.on_cleanup.append(self._on_cleanup)
+        return app
+
+    async def _on_startup(self, app: web.Application):
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        self.downloader = MajsoulPaipuDownloader(timeout=self.timeout)
+        await self.downloader.start()
+        await self.downloader.login(self.username, self.password)
+
+    async def _on_cleanup(self, app: web.Application):
+        if self._reconnecting is not None:
+            self._reconnecting.cancel()
+        if self.downloader is not None:
+            await self.downloader.close()
+
+    def _reconnect(self):
+        if self._reconnecting is None or self._reconnecting.done():
+            self._reconnecting = asyncio.ensure_future(self._restart())
+
+    async def _restart(self):
+        # the gateway dropped the websocket, open a new one. the token store spares the password login
+        try:
+            await self.downloader.close()
+        except Exception:
+            pass
+
+        try:
+            await self.downloader.start()
+            await self.downloader.login(self.username, self.password)
+        except Exception as e:
+            # the next request tries again
+            print(f"reconnecting failed: {e!r}", file=sys.stderr)
+
+    async def _download(self, record_uuid: str) -> dict:
+        async with self._semaphore:
+            return await self.downloader.download(record_uuid)
+
+    @staticmethod
+    def _encode(logs: dict) -> Iterator[bytes]:
+        """
+        the same bytes as json.dumps(logs), cut into the head fields and then one piece per kyoku
+        """
+        head = {k: v for k, v in logs.items() if k != "log"}
+        text = json.dumps(head, ensure_ascii=False)
+        yield (text[:-1] + (", " if len(head) != 0 else "") + '"log": [').encode("utf-8")
+
+        for i, kyoku in enumerate(logs["log"]):
+            yield ((", " if i != 0 else "") + json.dumps(kyoku, ensure_ascii=False)).encode("utf-8")
+        yield b"]}"
+
+    def _headers(self) -> dict[str, str]:
+        headers = {"Content-Type": "application/json; charset=utf-8"}
+        if self.cache_ttl is not None:
+            headers["Cache-Control"] = f"public, max-age={int(self.cache_ttl)}"
+        return headers
+
+    async def handle_paipu(self, request: web.Request) -> web.StreamResponse:
+        record_uuid = request.match_info["uuid"]
+        if not RECORD_UUID_PATTERN.match(record_uuid):
+            return web.json_response({"error": "invalid record uuid"}, status=400)
+
+        body = self.cache.get(record_uuid)
+        if body is not None:
+            return web.Response(body=body, headers=self._headers())
+
+        if self._reconnecting is not None and not self._reconnecting.done():
+            return self._unavailable()
+
+        try:
+            logs = await self._inflight.do(record_uuid, lambda: self._download(record_uuid))
+        except MajsoulDownloadError as e:
+            return web.json_response({"error": "download failed", "code": e.code}, status=502)
+        except asyncio.TimeoutError:
+            return web.json_response({"error": "download timed out"}, status=504)
+        except (ConnectionClosed, ConnectionError):
+            self._reconnect()
+            return self._unavailable()
+
+        # stream the log kyoku by kyoku as it is encoded, the client gets the head before the whole log is encoded
+        res = web.StreamResponse(headers=self._headers())
+        res.enable_chunked_encoding()
+        await res.prepare(request)
+
+        parts = []
+        for part in self._encode(logs):
+            parts.append(part)
+            await res.write(part)
+        await res.write_eof()
+
+        self.cache.put(record_uuid, b"".join(parts))
+        return res
+
+    @staticmethod
+    def _unavailable() -> web.Response:
+        return web.json_response({"error": "reconnecting to the server"}, status=503, headers={"Retry-After": "1"})
+
+
+def main():
+    parser = ArgumentParser(description="Serve MahjongSoul logs in tenhou.net/6 format over HTTP.")
+    parser.add_argument("-u", "--username", help="Your account name. (default: $TENSOUL_USERNAME)",
+                        dest="username", default=os.environ.get("TENSOUL_USERNAME"))
+    parser.add_argument("-p", "--password", help="Your account password. (default: $TENSOUL_PASSWORD)",
+                        dest="password", default=os.environ.get("TENSOUL_PASSWORD"))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-concurrency", type=int, default=8, help="Max downloads in flight.")
+    parser.add_argument("--cache-size", type=int, default=1024, help="Max number of cached logs.")
+    parser.add_argument("--cache-ttl", type=float, default=3600, help="Seconds to keep a cached log.")
+    parser.add_argument("--timeout", type=float, default=30, help="Seconds before a download is given up.")
+
+    args = parser.parse_args()
+    if not args.username or not args.password:
+        parser.error("username and password are required")
+
+    server = MajsoulPaipuServer(args.username, args.password,
+                                max_concurrency=args.max_concurrency,
+                                cache_size=args.cache_size,
+                                cache_ttl=args.cache_ttl,
+                                timeout=args.timeout)
+    web.run_app(server.make_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
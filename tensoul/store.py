@@ -0,0 +1,263 @@
+import json
+import sqlite3
+import sys
+import threading
+from argparse import ArgumentParser
+from concurrent.futures import Executor, ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional, Union, Collection, Iterator
+
+import ms.protocol_pb2 as pb
+
+from .constants import DAISUUSHI, DAISANGEN
+from .converter import convert_game_record_bytes
+from .fingerprint import converter_fingerprint
+from .record import iter_wrapped_records, decode_message, short_name
+
+# feature of games with a daisuushi or daisangen, the yakuman that may be paid under pao
+PAO_FEATURE = "pao"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS raw (
+    uuid TEXT PRIMARY KEY,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS features (
+    uuid TEXT NOT NULL,
+    feature TEXT NOT NULL,
+    PRIMARY KEY (feature, uuid)
+);
+CREATE TABLE IF NOT EXISTS logs (
+    uuid TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    log TEXT NOT NULL,
+    PRIMARY KEY (uuid, fingerprint)
+);
+"""
+
+
+def game_features(data: bytes) -> set[str]:
+    """
+    record types (RecordBaBei, ...) appearing in a serialized ResGameRecord, plus PAO_FEATURE
+    """
+    record = pb.ResGameRecord()
+    record.ParseFromString(data)
+
+    features = set()
+    wrapper = pb.Wrapper()
+    for wrapped in iter_wrapped_records(record.data):
+        wrapper.ParseFromString(wrapped)
+        name = short_name(wrapper.name)
+        features.add(name)
+
+        if name == "RecordHule":
+            for hule in decode_message(name, wrapper.data).hules:
+                if hule.yiman and any(e.id in (DAISUUSHI, DAISANGEN) for e in hule.fans):
+                    features.add(PAO_FEATURE)
+
+    return features
+
+
+def convert_with_features(data: bytes, *, fast_encode: bool = False) -> tuple[dict, set[str]]:
+    """
+    convert_game_record_bytes and game_features at once, so both can run in the same process pool job
+    """
+    return convert_game_record_bytes(data, fast_encode=fast_encode), game_features(data)
+
+
+class ConvertedLogStore:
+    """
+    sqlite store of raw game records and their converted logs, keyed by (uuid, converter fingerprint).
+
+    it can be shared between threads (e.g. used from run_in_executor), except iter_logs()
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.conn = sqlite3.connect(str(path), check_same_thread=False)
+        self.conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM raw").fetchone()[0]
+
+    def __contains__(self, record_uuid: str) -> bool:
+        with self._lock:
+            return self.conn.execute("SELECT 1 FROM raw WHERE uuid = ?", (record_uuid,)).fetchone() is not None
+
+    def uuids(self) -> list[str]:
+        with self._lock:
+            return [row[0] for row in self.conn.execute("SELECT uuid FROM raw ORDER BY uuid")]
+
+    def put_raw(self, record_uuid: str, data: bytes, features: Optional[Collection[str]] = None):
+        """
+        :param data: serialized ResGameRecord
+        :param features: game_features of data, if already known
+        """
+        if features is None:
+            features = game_features(data)
+        with self._lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO raw (uuid, data) VALUES (?, ?)", (record_uuid, data))
+            self.conn.execute("DELETE FROM features WHERE uuid = ?", (record_uuid,))
+            self.conn.executemany("INSERT INTO features (uuid, feature) VALUES (?, ?)",
+                                  [(record_uuid, f) for f in features])
+
+    def get_raw(self, record_uuid: str) -> Optional[bytes]:
+        with self._lock:
+            row = self.conn.execute("SELECT data FROM raw WHERE uuid = ?", (record_uuid,)).fetchone()
+        return row[0] if row is not None else None
+
+    def put_log(self, record_uuid: str, log: dict):
+        """
+        keep a converted log under the fingerprint stamped on it
+        """
+        fingerprint = log.get("fingerprint", converter_fingerprint())
+        text = json.dumps(log, ensure_ascii=False)
+        with self._lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO logs (uuid, fingerprint, log) VALUES (?, ?, ?)",
+                              (record_uuid, fingerprint, text))
+
+    def get_log(self, record_uuid: str, fingerprint: Optional[str] = None) -> Optional[dict]:
+        """
+        :param fingerprint: defaults to the converter in use
+        """
+        if fingerprint is None:
+            fingerprint = converter_fingerprint()
+
+        with self._lock:
+            row = self.conn.execute("SELECT log FROM logs WHERE uuid = ? AND fingerprint = ?",
+                                    (record_uuid, fingerprint)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def latest_log(self, record_uuid: str) -> Optional[dict]:
+        """
+        the log stored last, whatever converter made it
+        """
+        with self._lock:
+            row = self.conn.execute("SELECT log FROM logs WHERE uuid = ? ORDER BY rowid DESC LIMIT 1",
+                                    (record_uuid,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def iter_logs(self, fingerprint: Optional[str] = None) -> Iterator[dict]:
+        if fingerprint is None:
+            fingerprint = converter_fingerprint()
+
+        for row in self.conn.execute("SELECT log FROM logs WHERE fingerprint = ? ORDER BY uuid", (fingerprint,)):
+            yield json.loads(row[0])
+
+    def features(self, record_uuid: str) -> set[str]:
+        with self._lock:
+            return {row[0] for row in self.conn.execute("SELECT feature FROM features WHERE uuid = ?", (record_uuid,))}
+
+    def stale(self, fingerprint: Optional[str] = None, features: Optional[Collection[str]] = None) -> list[str]:
+        """
+        uuids of games without a log from the given converter
+
+        :param fingerprint: defaults to the converter in use
+        :param features: only games with any of these features
+        """
+        if fingerprint is None:
+            fingerprint = converter_fingerprint()
+
+        sql = "SELECT uuid FROM raw r WHERE NOT EXISTS " \
+              "(SELECT 1 FROM logs l WHERE l.uuid = r.uuid AND l.fingerprint = ?)"
+        params = [fingerprint]
+        if features is not None:
+            features = list(features)
+            sql += " AND uuid IN (SELECT uuid FROM features WHERE feature IN ({}))".format(
+                ", ".join("?" * len(features)))
+            params.extend(features)
+        sql += " ORDER BY uuid"
+
+        with self._lock:
+            return [row[0] for row in self.conn.execute(sql, params)]
+
+    def prune(self, fingerprint: Optional[str] = None) -> int:
+        """
+        drop the logs made by other converters than the given one
+
+        :return: number of logs dropped
+        """
+        if fingerprint is None:
+            fingerprint = converter_fingerprint()
+
+        with self._lock, self.conn:
+            return self.conn.execute("DELETE FROM logs WHERE fingerprint != ?", (fingerprint,)).rowcount
+
+
+def reconvert(store: ConvertedLogStore, *,
+              features: Optional[Collection[str]] = None,
+              executor: Optional[Executor] = None,
+              batch_size: int = 256) -> tuple[int, int]:
+    """
+    bring every game in the store up to the converter in use.
+
+    :param features: the converter change only affects games with any of these features (e.g. "RecordBaBei", "pao").
+                     other games get their last log restamped instead of being converted again
+    :param executor: convert in this pool
+    :return: number of games converted, number of games restamped
+    """
+    fingerprint = converter_fingerprint()
+
+    stale = store.stale(fingerprint)
+    affected = set(store.stale(fingerprint, features)) if features is not None else None
+
+    todo = []
+    restamped = 0
+    for record_uuid in stale:
+        old = store.latest_log(record_uuid) if affected is not None and record_uuid not in affected else None
+        if old is not None:
+            old["fingerprint"] = fingerprint
+            store.put_log(record_uuid, old)
+            restamped += 1
+        else:
+            todo.append(record_uuid)
+
+    for i in range(0, len(todo), batch_size):
+        batch = todo[i:i + batch_size]
+        raws = [store.get_raw(u) for u in batch]
+        logs = executor.map(convert_game_record_bytes, raws) if executor is not None \
+            else map(convert_game_record_bytes, raws)
+        for record_uuid, log in zip(batch, logs):
+            store.put_log(record_uuid, log)
+
+    return len(todo), restamped
+
+
+def main():
+    parser = ArgumentParser(description="Convert the games in a store again with the converter in use.")
+    parser.add_argument("store", help="Path of the store.")
+    parser.add_argument("--only", help="The converter change only affects games with any of these features, "
+                                       "e.g. RecordBaBei or pao. Other games are restamped without converting.",
+                        dest="only", nargs="+")
+    parser.add_argument("-w", "--workers", help="Number of processes converting records, 0 to convert in the "
+                                                "main process. (default: 0)", dest="workers", type=int, default=0)
+    parser.add_argument("--prune", help="Drop logs made by other converters afterwards.", dest="prune",
+                        action="store_true")
+
+    args = parser.parse_args()
+
+    executor = ProcessPoolExecutor(args.workers) if args.workers > 0 else None
+    try:
+        with ConvertedLogStore(args.store) as store:
+            converted, restamped = reconvert(store, features=args.only, executor=executor)
+            print(f"{converted} converted, {restamped} restamped, fingerprint {converter_fingerprint()}",
+                  file=sys.stderr)
+            if args.prune:
+                print(f"{store.prune()} outdated logs dropped", file=sys.stderr)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
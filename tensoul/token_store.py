@@ -0,0 +1,74 @@
+import json
+import os
+from pathlib import Path
+from typing import Protocol, Optional, Union
+
+
+class TokenStore(Protocol):
+    def get(self, username: str) -> Optional[str]:
+        ...
+
+    def set(self, username: str, token: str):
+        ...
+
+    def delete(self, username: str):
+        ...
+
+
+def default_token_path() -> Path:
+    cache_home = os.environ.get("XDG_CACHE_HOME")
+    if cache_home:
+        return Path(cache_home) / "tensoul" / "tokens.json"
+    return Path.home() / ".cache" / "tensoul" / "tokens.json"
+
+
+class FileTokenStore:
+    """
+    keep access tokens in a json file, username -> token.
+
+    the file is read on every access, so processes sharing it see each other's tokens.
+    """
+
+    def __init__(self, path: Union[str, Path, None] = None):
+        self._path = Path(path) if path is not None else None
+
+    @property
+    def path(self) -> Path:
+        # resolved lazily, creating the default store doesn't touch the environment
+        if self._path is None:
+            self._path = default_token_path()
+        return self._path
+
+    def _load(self) -> dict[str, str]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _dump(self, tokens: dict[str, str]):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with open(fd, "w", encoding="utf-8") as f:
+            json.dump(tokens, f)
+        os.replace(tmp, self.path)
+
+    def get(self, username: str) -> Optional[str]:
+        return self._load().get(username)
+
+    def set(self, username: str, token: str):
+        tokens = self._load()
+        if tokens.get(username) != token:
+            tokens[username] = token
+            self._dump(tokens)
+
+    def delete(self, username: str):
+        tokens = self._load()
+        if username in tokens:
+            del tokens[username]
+            self._dump(tokens)
+
+
+DEFAULT_TOKEN_STORE = FileTokenStore()
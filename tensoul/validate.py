@@ -0,0 +1,227 @@
+import json
+import sys
+from argparse import ArgumentParser
+from functools import cache
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, Iterator
+
+try:
+    import numpy as np
+except ImportError:  # optional, comes with tensoul[validate]
+    np = None
+
+from .constants import RUNES, JPNAME
+
+# checks a converted game can fail
+CHECKS = ("scores", "sticks", "final", "tiles")
+
+_AGARI = RUNES["agari"][JPNAME]
+
+
+class LogArrays:
+    """
+    a batch of converted logs flattened into arrays, one row per kyoku (or per game for ref, nplayers and sc).
+    seats absent from sanma are zero
+    """
+
+    def __init__(self, logs: Iterable[dict]):
+        refs, nplayers, sc = [], [], []
+        game, initscores, delta, sticks, riichi, agari = [], [], [], [], [], []
+        tile_kyoku, tiles = [], []
+
+        for g, log in enumerate(logs):
+            refs.append(log["ref"])
+            n = len(log["name"])
+            nplayers.append(n)
+            sc.append([log["sc"][2 * i] if i < n else 0 for i in range(4)])
+
+            for kyoku in log["log"]:
+                k = len(game)
+                game.append(g)
+                initscores.append(kyoku[1][:4] + [0] * (4 - len(kyoku[1])))
+                sticks.append(kyoku[0][2])
+
+                # round, initscores, doras, uras, then haipai, draws and discards of each seat, then the result
+                hands = kyoku[4:4 + 3 * n]
+                result = kyoku[4 + 3 * n] if len(kyoku) > 4 + 3 * n else ()
+
+                shown = list(kyoku[2]) + list(kyoku[3])
+                for i in range(n):
+                    shown.extend(hands[3 * i])
+                    shown.extend(t for t in hands[3 * i + 1] if isinstance(t, int))
+                tiles.extend(shown)
+                tile_kyoku.extend([k] * len(shown))
+
+                declared = [sum(1 for t in hands[3 * i + 2] if isinstance(t, str) and t[0] == "r") if i < n else 0
+                            for i in range(4)]
+
+                d = [0, 0, 0, 0]
+                won = len(result) != 0 and result[0] == _AGARI
+                if won:
+                    dealt_in = set()
+                    for agari_delta, info in zip(result[1::2], result[2::2]):
+                        for i, e in enumerate(agari_delta):
+                            d[i] += e
+                        if info[0] != info[1]:
+                            dealt_in.add(info[1])
+                    # a riichi declared on the tile dealt in is never accepted
+                    for seat in dealt_in:
+                        discards = hands[3 * seat + 2]
+                        if len(discards) != 0 and isinstance(discards[-1], str) and discards[-1][0] == "r":
+                            declared[seat] -= 1
+                elif len(result) > 1:
+                    for i, e in enumerate(result[1]):
+                        d[i] += e
+
+                delta.append(d)
+                riichi.append(declared)
+                agari.append(won)
+
+        self.refs: list[str] = refs
+        self.nplayers = np.array(nplayers, dtype=np.int64)
+        self.sc = np.array(sc, dtype=np.float64).reshape(-1, 4)
+
+        self.game = np.array(game, dtype=np.int64)  # game of each kyoku
+        self.initscores = np.array(initscores, dtype=np.float64).reshape(-1, 4)
+        self.delta = np.array(delta, dtype=np.float64).reshape(-1, 4)  # pao can pay half points
+        self.sticks = np.array(sticks, dtype=np.int64)  # riichi sticks on the table at the start
+        self.riichi = np.array(riichi, dtype=np.int64).reshape(-1, 4)  # accepted riichi of each seat
+        self.agari = np.array(agari, dtype=bool)
+
+        self.tile_kyoku = np.array(tile_kyoku, dtype=np.int64)  # kyoku of each shown tile
+        self.tiles = np.array(tiles, dtype=np.int64)  # haipai, draws and dora indicators
+
+    def __len__(self):
+        return len(self.refs)
+
+
+@cache
+def _tile_kinds() -> "np.ndarray":
+    """
+    :return: tenhou code -> index of its tile kind (0-33, aka counting as its 5), -1 if not a tile
+    """
+    kinds = np.full(64, -1, dtype=np.int64)
+    for suit in range(3):
+        kinds[10 * (suit + 1) + 1:10 * (suit + 1) + 10] = np.arange(9) + 9 * suit
+        kinds[51 + suit] = 4 + 9 * suit
+    kinds[41:48] = np.arange(27, 34)
+    return kinds
+
+
+def check_arrays(a: LogArrays) -> "dict[str, np.ndarray]":
+    """
+    :return: check name -> bool array over the games, True where the game fails it
+    """
+    ngames = len(a)
+    nkyoku = len(a.game)
+    failed = {c: np.zeros(ngames, dtype=bool) for c in CHECKS}
+    if nkyoku == 0:
+        return failed
+
+    after = a.initscores + a.delta - 1000 * a.riichi
+    # sticks left on the table after each kyoku, the winner takes them all
+    left = np.where(a.agari, 0, a.sticks + a.riichi.sum(axis=1))
+    same = a.game[1:] == a.game[:-1]
+
+    # scores: initscores + delta - accepted riichi are the initscores of the next kyoku
+    bad = same & np.any(after[:-1] != a.initscores[1:], axis=1)
+    failed["scores"][a.game[1:][bad]] = True
+
+    # sticks: the next kyoku starts with the sticks left
+    bad = same & (a.sticks[1:] != left[:-1])
+    failed["sticks"][a.game[1:][bad]] = True
+
+    # final: the scores after the last kyoku are the final points, except the sticks left may go to one player
+    last = np.flatnonzero(np.append(~same, True))
+    games = a.game[last]
+    diff = a.sc[games] - after[last]
+    total = diff.sum(axis=1)
+    bad = np.any(diff < 0, axis=1) | (np.count_nonzero(diff, axis=1) > 1) | \
+          ((total != 0) & (total != 1000 * left[last]))
+    failed["final"][games[bad]] = True
+
+    # tiles: no kind shown more than 4 times, no more tiles than the wall holds, no 2-8m in sanma
+    table = _tile_kinds()
+    kinds = table[np.clip(a.tiles, 0, len(table) - 1)]
+    valid = kinds >= 0
+    counts = np.bincount(a.tile_kyoku[valid] * 34 + kinds[valid], minlength=nkyoku * 34).reshape(nkyoku, 34)
+    sanma = a.nplayers[a.game] == 3
+    bad = np.any(counts > 4, axis=1) | (counts.sum(axis=1) > np.where(sanma, 108, 136)) | \
+          (sanma & np.any(counts[:, 1:8] != 0, axis=1))
+    bad[a.tile_kyoku[~valid]] = True
+    failed["tiles"][a.game[bad]] = True
+
+    return failed
+
+
+def validate_logs(logs: Iterable[dict]) -> dict[str, list[str]]:
+    """
+    check a batch of converted logs at once
+
+    :return: uuid -> names of the checks it fails, for the games failing any
+    """
+    a = LogArrays(logs)
+    failed = check_arrays(a)
+
+    report = {}
+    for c in CHECKS:
+        for g in np.flatnonzero(failed[c]):
+            report.setdefault(a.refs[g], []).append(c)
+    return report
+
+
+def _batched(logs: Iterable[dict], batch_size: int) -> Iterator[list[dict]]:
+    it = iter(logs)
+    while True:
+        batch = list(islice(it, batch_size))
+        if len(batch) == 0:
+            return
+        yield batch
+
+
+def _iter_json_logs(directory: Path) -> Iterable[dict]:
+    for p in sorted(directory.glob("*.json")):
+        with open(p, "r", encoding="utf-8") as f:
+            yield json.load(f)
+
+
+def main():
+    parser = ArgumentParser(description="Check the scores, riichi sticks and tiles of converted logs. "
+                                        "Prints the uuid and the failed checks of every inconsistent game.")
+    parser.add_argument("source", help="Directory of converted logs, or a store made by ConvertedLogStore.")
+    parser.add_argument("-b", "--batch-size", help="Number of games checked at once. (default: 100000)",
+                        dest="batch_size", type=int, default=100000)
+
+    args = parser.parse_args()
+
+    if np is None:
+        print("tensoul-validate needs numpy, install it with `pip install tensoul[validate]`", file=sys.stderr)
+        sys.exit(2)
+
+    checked = 0
+    invalid = 0
+
+    def check(logs: Iterable[dict]):
+        nonlocal checked, invalid
+        for batch in _batched(logs, args.batch_size):
+            report = validate_logs(batch)
+            for record_uuid, checks in report.items():
+                print(f"{record_uuid}\t{','.join(checks)}")
+            checked += len(batch)
+            invalid += len(report)
+
+    source = Path(args.source)
+    if source.is_dir():
+        check(_iter_json_logs(source))
+    else:
+        from .store import ConvertedLogStore
+        with ConvertedLogStore(source) as store:
+            check(store.iter_logs())
+
+    print(f"{checked} games checked, {invalid} inconsistent", file=sys.stderr)
+    sys.exit(1 if invalid != 0 else 0)
+
+
+if __name__ == "__main__":
+    main()
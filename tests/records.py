@@ -0,0 +1,32 @@
+import ms.protocol_pb2 as pb
+
+
+def wrap(msg) -> bytes:
+    return pb.Wrapper(name=f".lq.{msg.DESCRIPTOR.name}", data=msg.SerializeToString()).SerializeToString()
+
+
+def game_record(records: list, *, new: bool = True, uuid: str = "230101-00000000-0000-0000-0000-000000000000",
+                nplayers: int = 4):
+    """
+    a ResGameRecord of the given round records, in the actions format of version >= 210715 if new,
+    else in the older records format
+    """
+    details = pb.GameDetailRecords()
+    if new:
+        details.version = 210715
+        for r in records:
+            details.actions.add(result=wrap(r))
+    else:
+        details.records.extend(wrap(r) for r in records)
+
+    record = pb.ResGameRecord()
+    record.head.uuid = uuid
+    record.head.end_time = 1672531200
+    record.head.config.meta.mode_id = 12
+    record.head.config.mode.mode = 2
+    for seat in range(nplayers):
+        account = record.head.accounts.add(seat=seat, nickname=f"p{seat}")
+        account.level.id = 10301
+        record.head.result.players.add(seat=seat, part_point_1=25000)
+    record.data = wrap(details)
+    return record
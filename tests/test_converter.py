@@ -0,0 +1,54 @@
+import json
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+
+from records import game_record
+from test_fast_encode import random_records
+from tensoul.converter import convert_game_record, convert_game_record_lazy
+
+
+def dumps(res: dict) -> str:
+    return json.dumps(res, ensure_ascii=False)
+
+
+@pytest.fixture(scope="module")
+def process_pool():
+    with ProcessPoolExecutor(2) as pool:
+        yield pool
+
+
+@pytest.mark.parametrize("new", [True, False])
+@pytest.mark.parametrize("seed", range(20))
+def test_parallel_and_lazy_match_serial(seed, new, process_pool):
+    record = game_record(random_records(seed), new=new)
+    serial = dumps(convert_game_record(record))
+
+    with ThreadPoolExecutor(4) as pool:
+        assert dumps(convert_game_record(record, executor=pool)) == serial
+    if seed < 3:
+        assert dumps(convert_game_record(record, executor=process_pool)) == serial
+
+    lazy = convert_game_record_lazy(record)
+    # access the kyokus out of order, each is converted on its own
+    kyokus = [lazy["log"][i] for i in reversed(range(len(lazy["log"])))][::-1]
+    assert dumps({**lazy, "log": kyokus}) == serial
+    assert dumps({**lazy, "log": list(lazy["log"])}) == serial
+
+
+def test_unfinished_kyoku_is_left_out():
+    records = random_records(0)
+    # cut the game in the middle of its last kyoku
+    last = max(i for i, r in enumerate(records) if r.DESCRIPTOR.name == "RecordNewRound")
+    record = game_record(records[:last + 5])
+
+    serial = convert_game_record(record)
+    with ThreadPoolExecutor(2) as pool:
+        assert dumps(convert_game_record(record, executor=pool)) == dumps(serial)
+    assert len(convert_game_record_lazy(record)["log"]) == len(serial["log"]) == 2
+
+
+def test_lazy_log_is_not_json():
+    lazy = convert_game_record_lazy(game_record(random_records(1)))
+    with pytest.raises(TypeError):
+        json.dumps(lazy)
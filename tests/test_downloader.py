@@ -0,0 +1,144 @@
+import asyncio
+
+import ms.protocol_pb2 as pb
+import pytest
+from ms.base import MSRPCChannel
+from ms.rpc import Lobby
+
+from records import game_record
+from tensoul.downloader import MajsoulPaipuDownloader, _send_request
+
+
+class FakeWebSocket:
+    """
+    answers the requests sent through it when told to, feeding the responses to the channel's dispatcher
+    """
+
+    def __init__(self):
+        self.sent = []
+        self.incoming = asyncio.Queue()
+
+    async def send(self, pkt: bytes):
+        self.sent.append(pkt)
+
+    async def recv(self) -> bytes:
+        return await self.incoming.get()
+
+    async def close(self):
+        pass
+
+    def respond(self, data: bytes):
+        for pkt in self.sent:
+            wrapper = pb.Wrapper(data=data)
+            self.incoming.put_nowait(b"\x03" + pkt[1:3] + wrapper.SerializeToString())
+        self.sent.clear()
+
+
+def fake_channel() -> MSRPCChannel:
+    channel = MSRPCChannel("wss://localhost/gateway")
+    channel._ws = FakeWebSocket()
+    channel._msg_dispatcher = asyncio.ensure_future(channel.dispatch_msg())
+    return channel
+
+
+def assert_no_requests_left(channel: MSRPCChannel):
+    assert channel._req_events == {}
+    assert channel._res == {}
+
+
+def downloader(**kwargs) -> MajsoulPaipuDownloader:
+    d = MajsoulPaipuDownloader(token_store=None, **kwargs)
+    d.version_to_force = "0.0.0"
+    d.channel = fake_channel()
+    d.lobby = Lobby(d.channel)
+    return d
+
+
+def test_timeout_leaves_no_request():
+    async def main():
+        d = downloader(timeout=0.05)
+        with pytest.raises(asyncio.TimeoutError):
+            await d.fetch_game_record("x")
+        assert_no_requests_left(d.channel)
+
+        # the late response is dropped by the dispatcher
+        d.channel._ws.respond(b"late")
+        await asyncio.sleep(0.01)
+        assert_no_requests_left(d.channel)
+
+        await d.close()
+
+    asyncio.run(main())
+
+
+def test_lost_hedge_leaves_no_request():
+    async def main():
+        d = downloader(hedge=True, hedge_min_delay=0.01)
+        d.hedge_channel = fake_channel()
+        d.hedge_lobby = Lobby(d.hedge_channel)
+        d._latencies.extend([0.001] * 20)
+
+        async def answer_hedge():
+            while len(d.hedge_channel._ws.sent) == 0:
+                await asyncio.sleep(0.005)
+            d.hedge_channel._ws.respond(b"hedge")
+
+        answering = asyncio.ensure_future(answer_hedge())
+        assert await d.fetch_game_record("x") == b"hedge"
+        await answering
+        assert_no_requests_left(d.channel)
+        assert_no_requests_left(d.hedge_channel)
+
+        d.channel._ws.respond(b"late")
+        await asyncio.sleep(0.01)
+        assert_no_requests_left(d.channel)
+
+        await d.close()
+
+    asyncio.run(main())
+
+
+def test_timed_out_download_is_sent_again():
+    async def main():
+        d = downloader()
+        for i in range(2):
+            with pytest.raises(asyncio.TimeoutError):
+                await d.download("x", timeout=0.05)
+            await asyncio.sleep(0)
+            # every try sends its own request, the hung one is given up with its last caller
+            assert len(d.channel._ws.sent) == i + 1
+            assert len(d._inflight) == 0
+            assert_no_requests_left(d.channel)
+
+        await d.close()
+
+    asyncio.run(main())
+
+
+def test_shared_download_outlives_a_waiter():
+    async def main():
+        d = downloader()
+        record = game_record([])
+
+        patient = asyncio.ensure_future(d.download("x", timeout=5))
+        with pytest.raises(asyncio.TimeoutError):
+            await d.download("x", timeout=0.05)
+
+        # one request for both, still running for the caller that keeps waiting
+        assert len(d.channel._ws.sent) == 1
+        d.channel._ws.respond(record.SerializeToString())
+        assert (await patient)["ref"] == record.head.uuid
+        assert_no_requests_left(d.channel)
+
+        await d.close()
+
+    asyncio.run(main())
+
+
+def test_changed_channel_fails_loudly():
+    class Channel:
+        async def send_request(self, name, data):
+            return b""
+
+    with pytest.raises(RuntimeError, match="_new_req_idx"):
+        asyncio.run(_send_request(Channel(), ".lq.Lobby.fetchGameRecord", b""))
@@ -0,0 +1,203 @@
+import json
+import random
+
+import ms.protocol_pb2 as pb
+import pytest
+
+from tensoul.constants import DAISANGEN, DAISUUSHI
+from tensoul.parser import MajsoulPaipuParser
+
+TILES = [f"{n}{t}" for t in "mps" for n in range(10)] + [f"{n}z" for n in range(1, 8)]
+
+
+def dump(records, fast_encode: bool) -> str:
+    parser = MajsoulPaipuParser(fast_encode=fast_encode)
+    for r in records:
+        parser.feed(r)
+    return json.dumps([k.dump() for k in parser.getvalue()], ensure_ascii=False)
+
+
+def assert_same(records):
+    assert dump(records, True) == dump(records, False)
+
+
+def new_round(ju=0, nplayers=4, **kwargs):
+    rnd = random.Random(ju)
+    hands = {f"tiles{i}": [rnd.choice(TILES[:30]) for _ in range(14 if i == ju else 13)] for i in range(nplayers)}
+    return pb.RecordNewRound(chang=0, ju=ju, ben=1, liqibang=1, scores=[25000] * nplayers, doras=["1m"],
+                             **hands, **kwargs)
+
+
+def hule(seat, *, zimo=False, qinjia=False, fans=((1, 1),), yiman=False, li_doras=()):
+    h = pb.HuleInfo(seat=seat, zimo=zimo, qinjia=qinjia, yiman=yiman, count=13 if yiman else 3, fu=30,
+                    point_rong=32000 if yiman else 3900, point_zimo_xian=8000 if yiman else 1000,
+                    point_zimo_qin=16000 if yiman else 2000, li_doras=list(li_doras))
+    for fan_id, val in fans:
+        h.fans.add(id=fan_id, val=val)
+    return h
+
+
+def no_tile():
+    record = pb.RecordNoTile(liujumanguan=False)
+    record.scores.add(delta_scores=[1500, -1500, 1500, -1500])
+    return record
+
+
+def test_pon_kakan_aka():
+    assert_same([
+        new_round(),
+        pb.RecordDiscardTile(seat=0, tile="5m"),
+        pb.RecordChiPengGang(seat=2, type=1, tiles=["5m", "5m", "5m"], froms=[2, 2, 0]),
+        pb.RecordDiscardTile(seat=2, tile="9p"),
+        pb.RecordDealTile(seat=3, tile="1s"),
+        pb.RecordDiscardTile(seat=3, tile="0p"),
+        pb.RecordChiPengGang(seat=1, type=1, tiles=["5p", "5p", "0p"], froms=[1, 1, 3]),
+        pb.RecordDiscardTile(seat=1, tile="1z"),
+        pb.RecordDealTile(seat=2, tile="0m"),
+        pb.RecordAnGangAddGang(seat=2, type=2, tiles="0m"),
+        pb.RecordDealTile(seat=1, tile="5p"),
+        pb.RecordAnGangAddGang(seat=1, type=2, tiles="5p"),
+        no_tile(),
+    ])
+
+
+@pytest.mark.parametrize("tile", ["5s", "0s", "5m", "1z", "9p"])
+def test_ankan(tile):
+    assert_same([
+        new_round(ju=1),
+        pb.RecordAnGangAddGang(seat=1, type=3, tiles=tile),
+        pb.RecordDealTile(seat=1, tile="3m"),
+        pb.RecordDiscardTile(seat=1, tile="3m", moqie=True),
+        no_tile(),
+    ])
+
+
+@pytest.mark.parametrize("feeder", [1, 2, 3])
+def test_daiminkan(feeder):
+    assert_same([
+        new_round(),
+        pb.RecordDealTile(seat=feeder, tile="7s"),
+        pb.RecordDiscardTile(seat=feeder, tile="7s", moqie=True),
+        pb.RecordChiPengGang(seat=0, type=2, tiles=["7s", "7s", "7s", "7s"], froms=[0, 0, 0, feeder]),
+        pb.RecordDealTile(seat=0, tile="2m", doras=["1m", "4p"]),
+        pb.RecordDiscardTile(seat=0, tile="2m", moqie=True, doras=["1m", "4p"]),
+        no_tile(),
+    ])
+
+
+def test_chi_and_kita():
+    assert_same([
+        new_round(nplayers=3),
+        pb.RecordDiscardTile(seat=0, tile="3p"),
+        pb.RecordChiPengGang(seat=1, type=0, tiles=["4p", "0p", "3p"], froms=[1, 1, 0]),
+        pb.RecordDiscardTile(seat=1, tile="9s"),
+        pb.RecordDealTile(seat=2, tile="4z"),
+        pb.RecordBaBei(seat=2),
+        pb.RecordDealTile(seat=2, tile="2z"),
+        pb.RecordDiscardTile(seat=2, tile="2z", moqie=True),
+        no_tile(),
+    ])
+
+
+def test_riichi():
+    assert_same([
+        new_round(),
+        # the dealer's first discard of its 14th tile counts as tsumogiri
+        pb.RecordDiscardTile(seat=0, tile=new_round().tiles0[-1], is_liqi=True),
+        pb.RecordDealTile(seat=1, tile="2s"),
+        pb.RecordDiscardTile(seat=1, tile="2s", moqie=True, is_liqi=True),
+        pb.RecordDealTile(seat=2, tile="6m"),
+        pb.RecordDiscardTile(seat=2, tile="6m", moqie=True, is_liqi=True),
+        pb.RecordHule(hules=[hule(3, li_doras=["2p"])]),
+    ])
+
+
+@pytest.mark.parametrize("yaku,honors", [(DAISANGEN, ["5z", "6z", "7z"]), (DAISUUSHI, ["1z", "2z", "3z", "4z"])])
+@pytest.mark.parametrize("zimo", [False, True])
+def test_pao(yaku, honors, zimo):
+    records = [new_round()]
+    for i, t in enumerate(honors):
+        feeder = 3 if i == len(honors) - 1 else 1
+        records += [
+            pb.RecordDealTile(seat=feeder, tile=t),
+            pb.RecordDiscardTile(seat=feeder, tile=t, moqie=True),
+            pb.RecordChiPengGang(seat=2, type=1, tiles=[t, t, t], froms=[2, 2, feeder]),
+            pb.RecordDiscardTile(seat=2, tile="9m"),
+        ]
+    if zimo:
+        records += [pb.RecordDealTile(seat=2, tile="1p"),
+                    pb.RecordHule(hules=[hule(2, zimo=True, fans=((yaku, 1),), yiman=True)])]
+    else:
+        records += [pb.RecordHule(hules=[hule(2, fans=((yaku, 1),), yiman=True)])]
+    assert_same(records)
+
+
+def test_double_ron():
+    assert_same([
+        new_round(),
+        pb.RecordDealTile(seat=1, tile="4s"),
+        pb.RecordDiscardTile(seat=1, tile="4s", moqie=True, is_liqi=True),
+        pb.RecordDealTile(seat=2, tile="5s"),
+        pb.RecordDiscardTile(seat=2, tile="5s", moqie=True),
+        pb.RecordHule(hules=[hule(3, li_doras=["1p"]),
+                             hule(0, qinjia=True, fans=((DAISANGEN, 1),), yiman=True, li_doras=["1p", "2p"])]),
+    ])
+
+
+def random_records(seed: int) -> list:
+    rnd = random.Random(seed)
+    nplayers = rnd.choice([3, 4])
+    records = []
+    for k in range(3):
+        ju = rnd.randrange(nplayers)
+        hands = {f"tiles{i}": [rnd.choice(TILES) for _ in range(14 if i == ju else 13)] for i in range(nplayers)}
+        records.append(pb.RecordNewRound(chang=0, ju=ju, ben=k, liqibang=rnd.randrange(3),
+                                         scores=[25000] * nplayers, doras=[rnd.choice(TILES)], **hands))
+
+        pons = [[] for _ in range(nplayers)]
+        for _ in range(60):
+            seat = rnd.randrange(nplayers)
+            tile = rnd.choice(TILES + ["1z", "5z", "6z", "7z"] * 3)
+            doras = [rnd.choice(TILES) for _ in range(rnd.randrange(3))]
+            aka = tile if tile[0] != "5" or tile[1] == "z" else f"0{tile[1]}"
+
+            action = rnd.randrange(9)
+            if action == 0:
+                records.append(pb.RecordDiscardTile(seat=seat, tile=tile, moqie=rnd.random() < 0.5,
+                                                    is_liqi=rnd.random() < 0.1, doras=doras))
+            elif action == 1:
+                records.append(pb.RecordDealTile(seat=seat, tile=tile, doras=doras))
+            elif action == 2:
+                records.append(pb.RecordChiPengGang(seat=seat, type=0, tiles=[rnd.choice(TILES) for _ in range(3)]))
+            elif action == 3:
+                records.append(pb.RecordChiPengGang(seat=seat, type=1, tiles=[tile, tile, aka]))
+                pons[seat].append(tile)
+            elif action == 4:
+                records.append(pb.RecordChiPengGang(seat=seat, type=2, tiles=[tile] * 4))
+            elif action == 5:
+                records.append(pb.RecordAnGangAddGang(seat=seat, type=3, tiles=tile))
+            elif action == 6:
+                if len(pons[seat]) != 0 and rnd.random() < 0.8:
+                    tile = rnd.choice(pons[seat])
+                    aka = tile if tile[0] != "5" or tile[1] == "z" else f"0{tile[1]}"
+                records.append(pb.RecordAnGangAddGang(seat=seat, type=2, tiles=rnd.choice([tile, aka])))
+            elif action == 7:
+                records.append(pb.RecordBaBei(seat=seat))
+            else:
+                records.append(pb.RecordDiscardTile(seat=seat, tile=tile, moqie=True))
+
+        ldseat = rnd.randrange(nplayers)
+        winners = rnd.sample([i for i in range(nplayers) if i != ldseat], rnd.randint(1, 2))
+        records.append(pb.RecordDiscardTile(seat=ldseat, tile="1m"))
+        hules = []
+        for w in winners:
+            yaku = rnd.choice([DAISANGEN, DAISUUSHI, 1])
+            hules.append(hule(w, zimo=rnd.random() < 0.3, qinjia=w == ju, fans=((yaku, 1),), yiman=yaku != 1,
+                              li_doras=[rnd.choice(TILES)]))
+        records.append(pb.RecordHule(hules=hules))
+    return records
+
+
+@pytest.mark.parametrize("seed", range(300))
+def test_random_records(seed):
+    assert_same(random_records(seed))
@@ -0,0 +1,27 @@
+import subprocess
+import sys
+from pathlib import Path
+
+# what importing the parser must not pull in, the network stack and the protobuf messages
+HEAVY_MODULES = ("aiohttp", "websockets", "ms.rpc", "ms.base", "ms.protocol_pb2")
+
+ROOT = Path(__file__).parent.parent
+
+
+def run(code: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=ROOT)
+
+
+def test_parser_import_is_lazy():
+    code = "import sys\n" \
+           "from tensoul import MajsoulPaipuParser\n" \
+           f"loaded = set({HEAVY_MODULES!r}) & set(sys.modules)\n" \
+           "assert not loaded, sorted(loaded)\n"
+    res = run(code)
+    assert res.returncode == 0, res.stderr
+
+
+def test_downloader_is_still_exported():
+    code = "from tensoul import MajsoulPaipuDownloader\n"
+    res = run(code)
+    assert res.returncode == 0, res.stderr
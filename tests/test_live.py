@@ -0,0 +1,37 @@
+import ms.protocol_pb2 as pb
+import pytest
+
+from tensoul.live import MajsoulLiveParser
+
+HAND = ["1m", "2m", "3m", "4p", "5p", "6p", "7s", "8s", "9s", "1z", "1z", "2z", "2z"]
+
+
+def spectate(parser: MajsoulLiveParser):
+    parser.feed(pb.ActionNewRound(chang=0, ju=0, ben=0, liqibang=0, scores=[25000] * 4, doras=["1m"],
+                                  tiles=HAND + ["3z"]))
+    parser.feed(pb.ActionDiscardTile(seat=0, tile="3z", moqie=True))
+    parser.feed(pb.ActionDealTile(seat=1))
+
+
+def test_hidden_draws():
+    parser = MajsoulLiveParser(seat=0)
+    spectate(parser)
+    assert parser.unknown_seats == {1, 2, 3}
+
+    parser.feed(pb.ActionDiscardTile(seat=1, tile="9m", moqie=True))
+    no_tile = pb.RecordNoTile(liujumanguan=False)
+    no_tile.scores.add(delta_scores=[0, 0, 0, 0])
+    [kyoku] = parser.feed(no_tile)
+
+    # round, initscores, doras, uras, then haipai, draws and discards of each seat
+    assert kyoku[4] == [11, 12, 13, 24, 25, 26, 37, 38, 39, 41, 41, 42, 42]
+    assert kyoku[5] == [43]
+    assert kyoku[7:10] == [[], [], [60]]
+    assert parser.unknown_seats == {1, 2, 3}
+
+
+def test_hidden_discard():
+    parser = MajsoulLiveParser(seat=0)
+    spectate(parser)
+    with pytest.raises(ValueError, match="seat 1"):
+        parser.feed(pb.ActionDiscardTile(seat=1, moqie=True))
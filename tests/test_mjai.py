@@ -0,0 +1,102 @@
+import ms.protocol_pb2 as pb
+
+from tensoul.mjai import iter_mjai_events, mjai_tile
+
+HAND = ["1m", "2m", "3m", "4p", "6p", "7p", "1s", "3s", "4s", "9s", "9s", "7z", "7z"]
+
+
+def new_round(ju: int, scores: list[int], kyotaku: int = 0):
+    hands = {f"tiles{i}": HAND + (["3z"] if i == ju else []) for i in range(4)}
+    return pb.RecordNewRound(chang=0, ju=ju, ben=0, liqibang=kyotaku, scores=scores, doras=["1m"], **hands)
+
+
+def game() -> list:
+    hule = pb.RecordHule(delta_scores=[5800, 4900, 0, -9700])
+    hule.hules.add(seat=1, hu_tile="8s", zimo=False, point_rong=3900, li_doras=["2p"])
+    hule.hules.add(seat=0, hu_tile="8s", zimo=False, qinjia=True, point_rong=5800)
+
+    no_tile = pb.RecordNoTile(liujumanguan=False)
+    no_tile.scores.add(delta_scores=[1500, 1500, -1500, -1500])
+
+    return [
+        new_round(0, [25000] * 4),
+        # the dealer's 14th tile, dealt as its first tsumo
+        pb.RecordDiscardTile(seat=0, tile="3z", moqie=False),
+        pb.RecordDealTile(seat=1, tile="2s"),
+        pb.RecordDiscardTile(seat=1, tile="2s", moqie=True, is_liqi=True),
+        pb.RecordChiPengGang(seat=2, type=1, tiles=["2s", "2s", "2s"], froms=[2, 2, 1]),
+        pb.RecordDiscardTile(seat=2, tile="9m"),
+        pb.RecordDealTile(seat=3, tile="5p"),
+        pb.RecordAnGangAddGang(seat=3, type=3, tiles="5p", doras=["1m", "3p"]),
+        pb.RecordDealTile(seat=3, tile="7m", doras=["1m", "3p"]),
+        pb.RecordDiscardTile(seat=3, tile="7m", moqie=True),
+        pb.RecordDealTile(seat=0, tile="1z"),
+        pb.RecordDiscardTile(seat=0, tile="1z", moqie=True),
+        pb.RecordDealTile(seat=1, tile="9p"),
+        pb.RecordDiscardTile(seat=1, tile="9p", moqie=True),
+        pb.RecordDealTile(seat=2, tile="2s"),
+        pb.RecordAnGangAddGang(seat=2, type=2, tiles="2s"),
+        pb.RecordDealTile(seat=2, tile="8p"),
+        pb.RecordDiscardTile(seat=2, tile="8p", moqie=True),
+        pb.RecordDealTile(seat=3, tile="6s"),
+        # dealt in with the riichi declaration, which is never accepted
+        pb.RecordDiscardTile(seat=3, tile="8s", is_liqi=True),
+        hule,
+        new_round(1, [30800, 28900, 25000, 15300]),
+        pb.RecordDiscardTile(seat=1, tile="9s"),
+        no_tile,
+    ]
+
+
+def test_tiles():
+    assert mjai_tile("3m") == "3m"
+    assert mjai_tile("0p") == "5pr"
+    assert mjai_tile("5z") == "P"
+
+
+def test_events():
+    events = list(iter_mjai_events(game(), ["a", "b", "c", "d"]))
+
+    assert [e["type"] for e in events] == [
+        "start_game",
+        "start_kyoku", "tsumo", "dahai", "tsumo", "reach", "dahai", "reach_accepted", "pon", "dahai",
+        "tsumo", "ankan", "dora", "tsumo", "dahai", "tsumo", "dahai", "tsumo", "dahai",
+        "tsumo", "kakan", "tsumo", "dahai", "tsumo", "reach", "dahai", "hora", "hora", "end_kyoku",
+        "start_kyoku", "tsumo", "dahai", "ryukyoku", "end_kyoku",
+        "end_game",
+    ]
+
+    start = events[1]
+    assert start["oya"] == 0
+    assert len(start["tehais"][0]) == 13
+    assert events[2] == {"type": "tsumo", "actor": 0, "pai": "W"}
+    assert events[3]["tsumogiri"] is True
+
+    accepted = events[7]
+    assert accepted == {"type": "reach_accepted", "actor": 1, "deltas": [0, -1000, 0, 0],
+                        "scores": [25000, 24000, 25000, 25000]}
+    assert events[8] == {"type": "pon", "actor": 2, "target": 1, "pai": "2s", "consumed": ["2s", "2s"]}
+    assert events[11] == {"type": "ankan", "actor": 3, "consumed": ["5pr", "5p", "5p", "5p"]}
+    assert events[12] == {"type": "dora", "dora_marker": "3p"}
+    assert events[20] == {"type": "kakan", "actor": 2, "pai": "2s", "consumed": ["2s", "2s", "2s"]}
+
+
+def test_double_ron_scores():
+    events = list(iter_mjai_events(game()))
+    first, last = [e for e in events if e["type"] == "hora"]
+
+    # the first winner takes the riichi stick, whatever is left of the total goes to the last one
+    assert first["actor"] == 1 and first["target"] == 3
+    assert first["deltas"] == [0, 4900, 0, -3900]
+    assert first["uradora_markers"] == ["2p"]
+    assert last["actor"] == 0 and last["target"] == 3
+    assert last["deltas"] == [5800, 0, 0, -5800]
+
+    # scores carry over to the next kyoku, and the unaccepted riichi of seat 3 costs nothing
+    starts = [e for e in events if e["type"] == "start_kyoku"]
+    assert last["scores"] == starts[1]["scores"] == [30800, 28900, 25000, 15300]
+    assert starts[1]["kyotaku"] == 0
+
+    ryukyoku = next(e for e in events if e["type"] == "ryukyoku")
+    assert ryukyoku["deltas"] == [1500, 1500, -1500, -1500]
+    assert ryukyoku["scores"] == [32300, 30400, 23500, 13800]
@@ -0,0 +1,138 @@
+import asyncio
+
+import pytest
+
+import tensoul.pool
+from tensoul.errors import MajsoulDownloadError
+from tensoul.pool import MajsoulPaipuDownloaderPool, MajsoulAccount
+
+RATE_LIMITED = 1234
+
+
+class FakeDownloader:
+    """
+    stands in for the downloader of an account, answering with its username after delay seconds
+    """
+
+    delay = 0.0
+    fail = {}  # username -> MajsoulDownloadError code to fail with
+
+    def __init__(self, **kwargs):
+        self.username = None
+        self.calls = []
+
+    async def start(self):
+        pass
+
+    async def login(self, username, password):
+        self.username = username
+
+    async def close(self):
+        pass
+
+    async def download(self, record_uuid, *, timeout=None):
+        self.calls.append((record_uuid, timeout))
+        return await asyncio.wait_for(self._download(record_uuid), timeout)
+
+    async def _download(self, record_uuid):
+        await asyncio.sleep(self.delay)
+        if self.username in self.fail:
+            raise MajsoulDownloadError(self.fail[self.username])
+        return {"ref": record_uuid, "account": self.username}
+
+
+@pytest.fixture
+def fake_downloader(monkeypatch):
+    monkeypatch.setattr(tensoul.pool, "MajsoulPaipuDownloader", FakeDownloader)
+    monkeypatch.setattr(FakeDownloader, "delay", 0.0)
+    monkeypatch.setattr(FakeDownloader, "fail", {})
+    return FakeDownloader
+
+
+def accounts(n: int) -> list[MajsoulAccount]:
+    return [MajsoulAccount(f"user{i}", "password") for i in range(n)]
+
+
+def test_timeout_releases_account(fake_downloader):
+    fake_downloader.delay = 10
+
+    async def main():
+        async with MajsoulPaipuDownloaderPool(accounts(1), rate_limit_codes={RATE_LIMITED}) as pool:
+            with pytest.raises(asyncio.TimeoutError):
+                await pool.download("x", timeout=0.05)
+            await asyncio.sleep(0)
+
+            [slot] = pool._slots
+            # the account got the deadline, and is free again once it passed
+            [(_, timeout)] = slot.downloader.calls
+            assert 0 < timeout <= 0.05
+            assert slot.running == 0
+            assert len(pool._inflight) == 0
+
+    asyncio.run(main())
+
+
+def calls(pool: MajsoulPaipuDownloaderPool) -> dict[str, int]:
+    return {slot.account.username: len(slot.downloader.calls) for slot in pool._slots}
+
+
+def test_rate_limit_codes_are_required():
+    with pytest.raises(TypeError):
+        MajsoulPaipuDownloaderPool(accounts(1))
+
+
+def test_budget_is_spread(fake_downloader):
+    async def main():
+        async with MajsoulPaipuDownloaderPool(accounts(2), rate_limit_codes={RATE_LIMITED},
+                                              budget=2, period=0.3) as pool:
+            loop = asyncio.get_running_loop()
+            begin = loop.time()
+            res = await asyncio.gather(*[pool.download(str(i)) for i in range(4)])
+            assert loop.time() - begin < 0.2
+            assert sorted(r["account"] for r in res) == ["user0", "user0", "user1", "user1"]
+
+            # both budgets are spent, the fifth waits for the period to pass
+            await pool.download("4")
+            assert loop.time() - begin >= 0.3
+            assert sum(calls(pool).values()) == 5
+
+    asyncio.run(main())
+
+
+def test_rate_limited_account_is_parked(fake_downloader):
+    fake_downloader.fail = {"user0": RATE_LIMITED}
+
+    async def main():
+        async with MajsoulPaipuDownloaderPool(accounts(2), rate_limit_codes={RATE_LIMITED},
+                                              park_duration=60) as pool:
+            assert (await pool.download("x"))["account"] == "user1"
+            assert (await pool.download("y"))["account"] == "user1"
+            # user0 was tried once, then left alone
+            assert calls(pool) == {"user0": 1, "user1": 2}
+
+    asyncio.run(main())
+
+
+def test_one_chance_per_account(fake_downloader):
+    fake_downloader.fail = {f"user{i}": RATE_LIMITED for i in range(3)}
+
+    async def main():
+        async with MajsoulPaipuDownloaderPool(accounts(3), rate_limit_codes={RATE_LIMITED}) as pool:
+            with pytest.raises(MajsoulDownloadError):
+                await pool.download("x")
+            assert calls(pool) == {"user0": 1, "user1": 1, "user2": 1}
+
+    asyncio.run(main())
+
+
+def test_other_errors_are_not_retried(fake_downloader):
+    fake_downloader.fail = {"user0": 1}
+
+    async def main():
+        async with MajsoulPaipuDownloaderPool(accounts(2), rate_limit_codes={RATE_LIMITED}) as pool:
+            with pytest.raises(MajsoulDownloadError):
+                await pool.download("x")
+            assert calls(pool) == {"user0": 1, "user1": 0}
+            assert pool._slots[0].parked_until == 0
+
+    asyncio.run(main())
@@ -0,0 +1,92 @@
+import asyncio
+import json
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+from websockets.exceptions import ConnectionClosed
+
+import tensoul.server
+from tensoul.server import MajsoulPaipuServer
+
+
+class FakeDownloader:
+    """
+    a downloader whose websocket drops once, until it is started again
+    """
+
+    def __init__(self, **kwargs):
+        self.starts = 0
+        self.logins = 0
+        self.connected = False
+        self.drop = True
+
+    async def start(self):
+        self.starts += 1
+        self.connected = True
+
+    async def login(self, username, password):
+        self.logins += 1
+
+    async def close(self):
+        self.connected = False
+
+    async def download(self, record_uuid):
+        if self.drop:
+            self.drop = False
+            self.connected = False
+        if not self.connected:
+            raise ConnectionClosed(None, None)
+        return {"ref": record_uuid, "log": [[1, 2], [3, 4]]}
+
+
+@pytest.fixture
+def fake_downloader(monkeypatch):
+    monkeypatch.setattr(tensoul.server, "MajsoulPaipuDownloader", FakeDownloader)
+
+
+def test_reconnect(fake_downloader):
+    async def main():
+        server = MajsoulPaipuServer("user", "password")
+        async with TestClient(TestServer(server.make_app())) as client:
+            res = await client.get("/paipu/x")
+            assert res.status == 503
+            assert res.headers["Retry-After"] == "1"
+
+            await server._reconnecting
+            assert server.downloader.starts == 2
+            assert server.downloader.logins == 2
+
+            res = await client.get("/paipu/x")
+            assert res.status == 200
+            assert (await res.json())["ref"] == "x"
+
+    asyncio.run(main())
+
+
+def test_stream_matches_json_dumps():
+    logs = {"ver": "2.3", "ref": "x", "name": ["あ", "い"], "log": [[[0, 0, 0], [25000]], [[1, 0, 0], [24000]]]}
+    body = b"".join(MajsoulPaipuServer._encode(logs))
+    assert body == json.dumps(logs, ensure_ascii=False).encode("utf-8")
+
+    logs["log"] = []
+    assert b"".join(MajsoulPaipuServer._encode(logs)) == json.dumps(logs, ensure_ascii=False).encode("utf-8")
+
+
+def test_streamed_then_cached(fake_downloader):
+    async def main():
+        server = MajsoulPaipuServer("user", "password")
+        async with TestClient(TestServer(server.make_app())) as client:
+            server.downloader.drop = False
+            res = await client.get("/paipu/x")
+            assert res.status == 200
+            assert res.headers["Transfer-Encoding"] == "chunked"
+            body = await res.read()
+            assert json.loads(body) == {"ref": "x", "log": [[1, 2], [3, 4]]}
+
+            # the streamed bytes are cached and served in one piece
+            assert server.cache.get("x") == body
+            res = await client.get("/paipu/x")
+            assert res.headers["Content-Length"] == str(len(body))
+            assert await res.read() == body
+
+    asyncio.run(main())
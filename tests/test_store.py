@@ -0,0 +1,141 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import ms.protocol_pb2 as pb
+import pytest
+
+import tensoul.converter
+import tensoul.store
+from records import game_record
+from test_fast_encode import new_round, hule, no_tile
+from tensoul.constants import DAISANGEN
+from tensoul.converter import convert_game_record_bytes
+from tensoul.store import ConvertedLogStore, PAO_FEATURE, reconvert
+
+
+def uuid(i: int) -> str:
+    return f"230101-{i:08x}-0000-0000-0000-000000000000"
+
+
+PLAIN = [uuid(0), uuid(1)]
+BABEI = uuid(2)
+PAO = uuid(3)
+NEW = uuid(4)
+
+
+def plain(i: int) -> bytes:
+    records = [
+        new_round(ju=i % 4),
+        pb.RecordDealTile(seat=(i + 1) % 4, tile="2s"),
+        pb.RecordDiscardTile(seat=(i + 1) % 4, tile="2s", moqie=True),
+        no_tile(),
+    ]
+    return game_record(records, uuid=uuid(i)).SerializeToString()
+
+
+def babei() -> bytes:
+    records = [
+        new_round(nplayers=3),
+        pb.RecordDiscardTile(seat=0, tile="3p"),
+        pb.RecordDealTile(seat=1, tile="4z"),
+        pb.RecordBaBei(seat=1),
+        pb.RecordDealTile(seat=1, tile="2z"),
+        pb.RecordDiscardTile(seat=1, tile="2z", moqie=True),
+        no_tile(),
+    ]
+    return game_record(records, uuid=BABEI, nplayers=3).SerializeToString()
+
+
+def pao() -> bytes:
+    records = [new_round()]
+    for i, t in enumerate(["5z", "6z", "7z"]):
+        feeder = 3 if i == 2 else 1
+        records += [
+            pb.RecordDealTile(seat=feeder, tile=t),
+            pb.RecordDiscardTile(seat=feeder, tile=t, moqie=True),
+            pb.RecordChiPengGang(seat=2, type=1, tiles=[t, t, t], froms=[2, 2, feeder]),
+            pb.RecordDiscardTile(seat=2, tile="9m"),
+        ]
+    records.append(pb.RecordHule(hules=[hule(2, fans=((DAISANGEN, 1),), yiman=True)]))
+    return game_record(records, uuid=PAO).SerializeToString()
+
+
+class Fingerprint:
+    def __init__(self, value: str):
+        self.value = value
+
+    def __call__(self) -> str:
+        return self.value
+
+
+@pytest.fixture
+def fingerprint(monkeypatch):
+    fp = Fingerprint("v1")
+    # the store looks up stale logs, the converter stamps the new ones
+    monkeypatch.setattr(tensoul.store, "converter_fingerprint", fp)
+    monkeypatch.setattr(tensoul.converter, "converter_fingerprint", fp)
+    return fp
+
+
+@pytest.fixture
+def store(tmp_path, fingerprint):
+    """
+    games converted by v1, except NEW which has no log yet. the v1 logs are marked to tell them apart
+    """
+    with ConvertedLogStore(tmp_path / "logs.sqlite") as store:
+        raws = {PLAIN[0]: plain(0), PLAIN[1]: plain(1), BABEI: babei(), PAO: pao()}
+        for record_uuid, data in raws.items():
+            store.put_raw(record_uuid, data)
+            store.put_log(record_uuid, {**convert_game_record_bytes(data), "old": True})
+        store.put_raw(NEW, plain(4))
+        yield store
+
+
+def test_features(store):
+    assert "RecordBaBei" in store.features(BABEI)
+    assert PAO_FEATURE in store.features(PAO)
+    for record_uuid in PLAIN + [NEW]:
+        assert not store.features(record_uuid) & {"RecordBaBei", PAO_FEATURE}
+
+
+def test_stale(store, fingerprint):
+    assert store.stale() == [NEW]
+
+    fingerprint.value = "v2"
+    assert store.stale() == sorted(PLAIN + [BABEI, PAO, NEW])
+    assert store.stale(features=["RecordBaBei"]) == [BABEI]
+    assert store.stale(features=[PAO_FEATURE]) == [PAO]
+    assert store.stale("v1") == [NEW]
+
+
+def test_reconvert_affected(store, fingerprint):
+    fingerprint.value = "v2"
+    assert reconvert(store, features=["RecordBaBei", PAO_FEATURE], batch_size=2) == (3, 2)
+    assert store.stale() == []
+
+    # the other games keep their log under the new fingerprint
+    for record_uuid in PLAIN:
+        log = store.get_log(record_uuid)
+        assert log["old"] is True and log["fingerprint"] == "v2"
+    # the affected ones and the one never converted are converted again
+    for record_uuid in [BABEI, PAO, NEW]:
+        log = store.get_log(record_uuid)
+        assert "old" not in log and log["fingerprint"] == "v2"
+        assert log["ref"] == record_uuid
+
+    assert store.get_log(BABEI, "v1")["old"] is True
+    assert store.prune() == 4
+    assert store.get_log(BABEI, "v1") is None
+    assert len(list(store.iter_logs())) == 5
+
+    assert reconvert(store, features=["RecordBaBei", PAO_FEATURE]) == (0, 0)
+
+
+def test_reconvert_all(store, fingerprint):
+    fingerprint.value = "v2"
+    with ThreadPoolExecutor(2) as pool:
+        assert reconvert(store, executor=pool) == (5, 0)
+
+    for record_uuid in PLAIN + [BABEI, PAO, NEW]:
+        log = store.get_log(record_uuid)
+        assert "old" not in log and log["fingerprint"] == "v2"
+    assert store.latest_log(PAO) == store.get_log(PAO)
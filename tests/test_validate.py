@@ -0,0 +1,130 @@
+import copy
+import random
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from tensoul.validate import CHECKS, validate_logs
+
+ROOT = Path(__file__).parent.parent
+
+AGARI = "和了"
+RYUUKYOKU = "流局"
+
+
+def wall(sanma: bool, seed: int = 0) -> list[int]:
+    kinds = [10 * s + n for s in (1, 2, 3) for n in range(1, 10)] + list(range(41, 48))
+    if sanma:
+        kinds = [k for k in kinds if not 12 <= k <= 18]
+    tiles = kinds * 4
+    random.Random(seed).shuffle(tiles)
+    return tiles
+
+
+def kyoku(kyoku_id: list[int], initscores: list[int], discards: list[list], result: list, seed: int) -> list:
+    n = len(initscores)
+    tiles = wall(n == 3, seed)
+    res = [kyoku_id, initscores, tiles[:1], tiles[1:2]]
+    tiles = tiles[2:]
+    for i in range(n):
+        haipai, draws, tiles = tiles[:13], tiles[13:13 + len(discards[i])], tiles[13 + len(discards[i]):]
+        res += [haipai, draws, discards[i]]
+    res.append(result)
+    return res
+
+
+def yonma() -> dict:
+    log = [
+        # seat 1 riichi is accepted, seat 3 declares riichi on the tile it deals in, seat 0 takes the stick
+        kyoku([0, 0, 0], [25000, 25000, 25000, 25000],
+              [[60, 60], ["r15", 60], [60, 60], [60, "r17"]],
+              [AGARI, [8700, 0, 0, -7700], [0, 3, 0, "7700"]], seed=0),
+        # seat 2 riichi and tenpai, the stick stays on the table
+        kyoku([1, 0, 0], [33700, 24000, 25000, 17300],
+              [[60], [60], ["r21"], [60]],
+              [RYUUKYOKU, [-1000, -1000, 3000, -1000]], seed=1),
+        kyoku([1, 1, 1], [32700, 23000, 27000, 16300],
+              [[60], [60], [60], [60]],
+              [RYUUKYOKU, [0, 0, 0, 0]], seed=2),
+    ]
+    # the stick left goes to the top
+    return {"ref": "yonma", "name": ["a", "b", "c", "d"], "log": log,
+            "sc": [33700, 43.7, 23000, -17.0, 27000, 7.0, 16300, -33.7]}
+
+
+def sanma() -> dict:
+    log = [
+        # tsumo, seat 2 riichi is accepted and the winner takes the stick
+        kyoku([0, 0, 0], [35000, 35000, 35000],
+              [[60, 60], [60, 60], ["r31", 60]],
+              [AGARI, [5000, -2000, -3000], [0, 0, 0, "2000-4000"]], seed=3),
+        kyoku([1, 0, 0], [40000, 33000, 31000],
+              [[60], [60], [60]],
+              [RYUUKYOKU, [-2000, 1000, 1000]], seed=4),
+    ]
+    return {"ref": "sanma", "name": ["a", "b", "c"], "log": log,
+            "sc": [38000, 23.0, 34000, -1.0, 32000, -22.0]}
+
+
+def corrupt(check: str, log: dict) -> dict:
+    log = copy.deepcopy(log)
+    if check == "scores":
+        log["log"][0][-1][1][0] += 100
+    elif check == "sticks":
+        log["log"][1][0][2] = 1
+    elif check == "final":
+        log["sc"][2] -= 1000
+    elif check == "tiles":
+        log["log"][0][5].extend([11] * 5)
+    log["ref"] = f"{log['ref']}-{check}"
+    return log
+
+
+@pytest.mark.parametrize("make", [yonma, sanma])
+def test_consistent(make):
+    assert validate_logs([make()]) == {}
+
+
+@pytest.mark.parametrize("make", [yonma, sanma])
+@pytest.mark.parametrize("check", CHECKS)
+def test_each_check(make, check):
+    log = corrupt(check, make())
+    assert validate_logs([make(), log]) == {log["ref"]: [check]}
+
+
+def test_batch():
+    logs = [yonma(), sanma()] + [corrupt(c, make()) for make in (yonma, sanma) for c in CHECKS]
+    report = validate_logs(logs)
+    assert report == {log["ref"]: [log["ref"].split("-")[1]] for log in logs[2:]}
+
+
+def test_riichi_dealt_in_is_not_accepted():
+    log = yonma()
+    # the same riichi on a tile nobody wins off costs a stick
+    log["log"][0][4 + 3 * 3 + 2] = ["r17", 60]
+    assert validate_logs([log]) == {"yonma": ["scores"]}
+
+
+def test_sanma_has_no_2_to_8m():
+    log = sanma()
+    log["log"][1][4][0] = 12
+    assert validate_logs([log]) == {"sanma": ["tiles"]}
+
+
+def test_invalid_tile_code():
+    log = yonma()
+    log["log"][2][5].append(99)
+    assert validate_logs([log]) == {"yonma": ["tiles"]}
+
+
+def test_main_without_numpy(tmp_path):
+    code = "import sys\n" \
+           "sys.modules['numpy'] = None\n" \
+           f"sys.argv = ['tensoul-validate', {str(tmp_path)!r}]\n" \
+           "from tensoul.validate import main\n" \
+           "main()\n"
+    res = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=ROOT)
+    assert res.returncode == 2
+    assert "pip install tensoul[validate]" in res.stderr